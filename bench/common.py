@@ -0,0 +1,32 @@
+"""Shared helpers for the benchmark scripts in this directory."""
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_quiz():
+    """Import ``quiz copy.py`` as the module ``quiz``."""
+    spec = importlib.util.spec_from_file_location('quiz', os.path.join(ROOT, 'quiz copy.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['quiz'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_app(database_uri=None, **config):
+    """Build the app with ``create_app``, optionally pointed at another database, and initialise its database.
+
+    Returns ``(module, app)``.
+    """
+    if database_uri:
+        config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    quiz = import_quiz()
+    app = quiz.create_app(config)
+    if not os.path.isdir(os.path.join(ROOT, 'templates')):
+        # the templates live in "templates copy" in this checkout
+        app.template_folder = os.path.join(ROOT, 'templates copy')
+    with app.app_context():
+        quiz.init_database()
+    return quiz, app
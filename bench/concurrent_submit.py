@@ -0,0 +1,98 @@
+"""Concurrent quiz submissions against one SQLite file.
+
+Starts several worker processes, like a pre-fork server would, and has each
+post ``submit_quiz`` in a loop. Reports commits per second and how many
+submissions failed (e.g. "database is locked").
+
+    python bench/concurrent_submit.py --workers 8 --submissions 200
+    python bench/concurrent_submit.py --journal-mode DELETE --synchronous FULL   # SQLite defaults
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from datetime import date
+
+from common import load_app
+
+
+def setup(database_uri, options, questions):
+    quiz, app = load_app(database_uri, **options)
+    with app.app_context():
+        subject = quiz.Subject(name='Load test')
+        quiz.db.session.add(subject)
+        quiz.db.session.flush()
+        chapter = quiz.Chapter(name='Load test', questions_count=questions, subject_id=subject.id)
+        quiz.db.session.add(chapter)
+        quiz.db.session.flush()
+        test_quiz = quiz.Quiz(quiz_name='Load test', duration=10, chapter_id=chapter.id, subject_id=subject.id)
+        quiz.db.session.add(test_quiz)
+        quiz.db.session.flush()
+        for number in range(questions):
+            quiz.db.session.add(quiz.Question(quiz_id=test_quiz.id, title=f'Q{number}', question='?', option1='a',
+                                              option2='b', option3='c', option4='d', correct=1))
+        user = quiz.User(username='load@test', password='x', name='Load', qualification='-', dob=date(2000, 1, 1))
+        quiz.db.session.add(user)
+        quiz.db.session.commit()
+        return test_quiz.id, user.id
+
+
+def worker(database_uri, options, quiz_id, user_id, submissions, start, results):
+    quiz, app = load_app(database_uri, **options)
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    ok = failed = 0
+    start.wait()
+    for _ in range(submissions):
+        response = client.post(f'/submit/quiz/{quiz_id}', data={'q1': '1'})
+        if response.status_code == 302:
+            ok += 1
+        else:
+            failed += 1
+    with app.app_context():
+        # submissions are committed by the writer thread, count them once they are in
+        quiz.submission_queue().flush()
+    results.put((ok, failed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--submissions', type=int, default=200, help='submissions per worker')
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--journal-mode', default='WAL')
+    parser.add_argument('--synchronous', default='NORMAL')
+    parser.add_argument('--busy-timeout', type=int, default=5000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database_uri = f"sqlite:///{os.path.join(directory, 'load.db')}"
+    options = {'SQLITE_JOURNAL_MODE': args.journal_mode, 'SQLITE_SYNCHRONOUS': args.synchronous,
+               'SQLITE_BUSY_TIMEOUT': args.busy_timeout}
+    quiz_id, user_id = setup(database_uri, options, args.questions)
+
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(database_uri, options, quiz_id, user_id, args.submissions, start, results))
+                 for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    time.sleep(2)
+    started = time.perf_counter()
+    start.set()
+    totals = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+
+    ok = sum(result[0] for result in totals)
+    failed = sum(result[1] for result in totals)
+    print(f"{args.workers} workers, journal_mode={args.journal_mode}, synchronous={args.synchronous}, busy_timeout={args.busy_timeout}ms")
+    print(f"{ok} committed, {failed} failed ({failed / (ok + failed):.1%}) in {elapsed:.2f}s -> {ok / elapsed:.0f} commits/s")
+
+
+if __name__ == '__main__':
+    main()
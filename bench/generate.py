@@ -0,0 +1,138 @@
+"""Seeded synthetic data for the benchmarks.
+
+Fills a database with users, subjects, chapters, quizzes, questions and
+scores sized from the number of scores asked for, then rebuilds the rollups
+and leaderboards the way ``rebuild-rollups`` / ``rebuild-leaderboards`` would.
+The same seed and scale always give the same data. Every generated user
+logs in with the password ``bench``.
+
+    python bench/generate.py --scores 100000 --database /tmp/bench.db
+    python bench/generate.py --scale 1m --database /tmp/bench-1m.db
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from common import load_app
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+PASSWORD = 'bench'
+CHUNK = 10000
+WORDS = ('algebra geometry calculus vectors matrices probability statistics optics motion energy waves atoms '
+         'cells genetics ecology grammar poetry history trade climate rivers empires logic sets graphs').split()
+
+
+def sizes(scores):
+    """How many of each row go with ``scores`` score rows."""
+    subjects = min(max(scores // 20000, 3), 50)
+    chapters = subjects * 5
+    quizzes = chapters * 4
+    return {
+        'users': min(max(scores // 20, 50), 50000),
+        'subjects': subjects,
+        'chapters': chapters,
+        'quizzes': quizzes,
+        'questions': quizzes * 10,
+        'scores': scores,
+    }
+
+
+def phrase(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def insert_chunks(quiz, model, rows):
+    for start in range(0, len(rows), CHUNK):
+        quiz.db.session.execute(quiz.insert(model), rows[start:start + CHUNK])
+
+
+def generate(quiz, scores, seed=0):
+    """Add a generated data set to the app's database, returns the row counts. Needs an app context."""
+    rng = random.Random(seed)
+    counts = sizes(scores)
+    db = quiz.db
+
+    def next_id(model):
+        return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+    password = quiz.hash_password(PASSWORD)
+    first_user = next_id(quiz.User)
+    users = [dict(id=first_user + number, username=f'user{seed}-{number}@bench', name=f'Bench User {number}', password=password,
+                  qualification=rng.choice(('School', 'Graduate', 'Postgraduate')),
+                  dob=date(1990, 1, 1) + timedelta(days=rng.randrange(8000)), is_admin=False)
+             for number in range(counts['users'])]
+    insert_chunks(quiz, quiz.User, users)
+
+    first_subject = next_id(quiz.Subject)
+    subjects = [dict(id=first_subject + number, name=f'{phrase(rng, 2).title()} {seed}-{number}', description=phrase(rng, 8))
+                for number in range(counts['subjects'])]
+    insert_chunks(quiz, quiz.Subject, subjects)
+
+    first_chapter = next_id(quiz.Chapter)
+    chapters = [dict(id=first_chapter + number, name=phrase(rng, 2).title(), description=phrase(rng, 8), questions_count=10,
+                     subject_id=subjects[number // 5]['id'])
+                for number in range(counts['chapters'])]
+    insert_chunks(quiz, quiz.Chapter, chapters)
+
+    first_quiz = next_id(quiz.Quiz)
+    quizzes = [dict(id=first_quiz + number, quiz_name=f'{phrase(rng, 2).title()} quiz', duration=rng.choice((5, 10, 15, 30)),
+                    chapter_id=chapters[number // 4]['id'], subject_id=chapters[number // 4]['subject_id'], content_version=0)
+               for number in range(counts['quizzes'])]
+    insert_chunks(quiz, quiz.Quiz, quizzes)
+
+    first_question = next_id(quiz.Question)
+    questions = [dict(id=first_question + number, quiz_id=quizzes[number // 10]['id'], title=phrase(rng, 3).capitalize(),
+                      question=phrase(rng, 12) + '?', option1=phrase(rng, 2), option2=phrase(rng, 2), option3=phrase(rng, 2),
+                      option4=phrase(rng, 2), correct=rng.randint(1, 4))
+                 for number in range(counts['questions'])]
+    insert_chunks(quiz, quiz.Question, questions)
+    answer_key = {}
+    for question in questions:
+        answer_key.setdefault(question['quiz_id'], {})[question['id']] = question['correct']
+
+    # a few popular quizzes get most attempts, stronger users score higher
+    quiz_weights = [1 / (rank + 1) for rank in range(len(quizzes))]
+    skill = [rng.random() for _ in users]
+    now = datetime.utcnow()
+    for start in range(0, scores, CHUNK):
+        rows = []
+        for user_index, picked in zip(rng.choices(range(len(users)), k=min(CHUNK, scores - start)),
+                                      rng.choices(quizzes, weights=quiz_weights, k=min(CHUNK, scores - start))):
+            key = answer_key[picked['id']]
+            answers = {question_id: correct if rng.random() < skill[user_index] else rng.randint(1, 4) for question_id, correct in key.items()}
+            rows.append(dict(user_id=users[user_index]['id'], quiz_id=picked['id'], chapter_id=picked['chapter_id'],
+                             subject_id=picked['subject_id'], score=sum(answers[question_id] == correct for question_id, correct in key.items()),
+                             total=len(key), answers=quiz.dump_answers(answers),
+                             created_at=now - timedelta(seconds=rng.randrange(90 * 24 * 3600))))
+        insert_chunks(quiz, quiz.Scores, rows)
+
+    quiz.rebuild_rollups()
+    quiz.rebuild_user_rollups()
+    quiz.rebuild_leaderboards()
+    db.session.commit()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', required=True, help='SQLite file to create or add to')
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument('--scale', choices=SCALES, default='10k')
+    size.add_argument('--scores', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    scores = args.scores or SCALES[args.scale]
+    quiz, app = load_app(f"sqlite:///{os.path.abspath(args.database)}")
+    started = time.perf_counter()
+    with app.app_context():
+        counts = generate(quiz, scores, args.seed)
+    print(json.dumps(counts))
+    print(f"generated in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Batch grading throughput, and regrading stored attempts.
+
+Grades ``--submissions`` random submissions to a ``--questions`` question
+quiz with ``grade_batch`` and with the per-question loop ``submit_quiz`` used
+before it, then stores ``--attempts`` attempts, flips one answer and times
+``regrade_quiz`` over them.
+
+    python bench/grading.py --submissions 200000 --attempts 100000 --batch-size 5000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime
+
+from common import load_app
+from generate import CHUNK
+
+
+def per_question(questions, form):
+    # the loop submit_quiz ran before grade_batch, one ORM-like row and one form lookup per question
+    score = 0
+    for question in questions:
+        selected = form.get(f"q{question['id']}")
+        if selected:
+            if int(selected) == question['correct']:
+                score += 1
+    return score
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--submissions', type=int, default=200000)
+    parser.add_argument('--questions', type=int, default=20)
+    parser.add_argument('--attempts', type=int, default=100000, help='stored attempts regraded')
+    parser.add_argument('--batch-size', type=int, default=5000, help='regrade rows per transaction')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    directory = tempfile.mkdtemp()
+    quiz, app = load_app(f"sqlite:///{os.path.join(directory, 'grading.db')}")
+    with app.app_context():
+        db = quiz.db
+        subject = quiz.Subject(name='Grading')
+        db.session.add(subject)
+        db.session.flush()
+        chapter = quiz.Chapter(name='Grading', questions_count=args.questions, subject_id=subject.id)
+        db.session.add(chapter)
+        db.session.flush()
+        test_quiz = quiz.Quiz(quiz_name='Grading', duration=10, chapter_id=chapter.id, subject_id=subject.id)
+        db.session.add(test_quiz)
+        db.session.flush()
+        db.session.execute(quiz.insert(quiz.Question), [
+            dict(quiz_id=test_quiz.id, chapter_id=chapter.id, title=f'Q{number}', question='?', option1='a', option2='b',
+                 option3='c', option4='d', correct=rng.randint(1, 4))
+            for number in range(args.questions)])
+        db.session.execute(quiz.insert(quiz.User), [
+            dict(username=f'grader{number}@bench', password='x', name='Grader', qualification='-', dob=date(2000, 1, 1))
+            for number in range(1000)])
+        db.session.commit()
+        user_ids = [row[0] for row in db.session.query(quiz.User.id).filter(quiz.User.username.like('grader%@bench'))]
+        questions, answer_key = quiz.question_cache().get(test_quiz)
+        rows = [{'id': question_id, 'correct': correct} for question_id, correct in answer_key.items()]
+
+        forms = [{f"q{question_id}": str(rng.randint(1, 4)) for question_id in answer_key if rng.random() < 0.95}
+                 for _ in range(args.submissions)]
+        started = time.perf_counter()
+        before = [per_question(rows, form) for form in forms]
+        loop_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        submissions = [{question_id: quiz.parse_choice(form.get(f"q{question_id}")) for question_id in answer_key} for form in forms]
+        parse_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        after = quiz.grade_batch(answer_key, submissions)
+        batch_seconds = time.perf_counter() - started
+        assert before == after
+        print(f"{args.submissions} submissions x {args.questions} questions: per-question loop {loop_seconds:.2f}s (form parsing included), "
+              f"parse_choice {parse_seconds:.2f}s + grade_batch {batch_seconds:.2f}s "
+              f"-> {args.submissions / batch_seconds:,.0f} submissions/s graded")
+
+        now = datetime.utcnow()
+        for start in range(0, args.attempts, CHUNK):
+            stored = submissions[start % len(submissions):][:min(CHUNK, args.attempts - start)]
+            db.session.execute(quiz.insert(quiz.Scores), [
+                dict(user_id=rng.choice(user_ids), quiz_id=test_quiz.id, chapter_id=chapter.id, subject_id=subject.id,
+                     score=score, total=args.questions, answers=quiz.dump_answers(answers), created_at=now)
+                for answers, score in zip(stored, quiz.grade_batch(answer_key, stored))])
+        quiz.rebuild_rollups()
+        quiz.rebuild_user_rollups()
+        quiz.rebuild_leaderboards()
+        db.session.commit()
+
+        # an admin fixes one answer, every stored attempt gets regraded
+        fixed = min(answer_key)
+        quiz.Question.query.filter_by(id=fixed).update({quiz.Question.correct: answer_key[fixed] % 4 + 1})
+        quiz.questions_changed(test_quiz.id)
+        db.session.commit()
+        started = time.perf_counter()
+        changed = quiz.regrade_quiz(test_quiz.id, args.batch_size)
+        seconds = time.perf_counter() - started
+        print(f"regrade-quiz over {args.attempts} stored attempts, batch size {args.batch_size}: {seconds:.2f}s "
+              f"({args.attempts / seconds:,.0f} attempts/s), scores changed for {changed} users")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Route latency with and without the model index set.
+
+Generates a data set (see generate.py), times the student routes through the
+test client, then drops the secondary indexes the index-set migration added,
+so the schema matches a database from before it, and times them again.
+
+    python bench/indexes.py --scores 300000 --repeat 20
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import load_app
+from generate import PASSWORD, generate
+
+# the indexes migration 3 added, the Scores and Question lookups every student page makes
+INDEX_SET = ('ix_user_username', 'ix_chapter_subject_id', 'ix_quiz_chapter_id', 'ix_quiz_subject_id', 'ix_question_quiz_id',
+             'ix_question_chapter_id', 'ix_scores_user_quiz', 'ix_scores_quiz_id', 'ix_scores_chapter_id', 'ix_scores_subject_id')
+
+
+def measure(quiz, app, username, quiz_id, repeat):
+    client = app.test_client()
+    analytics = app.extensions['analytics_cache']
+    routes = {
+        'login': lambda: client.post('/login', data={'username': username, 'password': PASSWORD}),
+        'user_dashboard': lambda: client.get('/user/dashboard'),
+        'user_scores': lambda: client.get(f'/user/scores/{quiz_id}'),
+        # the summary is cached per worker, drop it so every request computes it
+        'user_summary': lambda: (analytics.invalidate(), client.get('/user/summary/data'))[1],
+        'leaderboard': lambda: client.get(f'/leaderboard/quiz/{quiz_id}'),
+    }
+    timings = {}
+    for name, request in routes.items():
+        assert request().status_code in (200, 302), name
+        started = time.perf_counter()
+        for _ in range(repeat):
+            request()
+        timings[name] = (time.perf_counter() - started) / repeat
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scores', type=int, default=300000)
+    parser.add_argument('--repeat', type=int, default=20, help='requests per route, the mean is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    # a cheap hash so login measures the user lookup rather than scrypt
+    quiz, app = load_app(f"sqlite:///{os.path.join(directory, 'indexes.db')}", PASSWORD_HASH_METHOD='pbkdf2:sha256:1',
+                         SUBMIT_QUEUE_SIZE=0)
+    with app.app_context():
+        counts = generate(quiz, args.scores, args.seed)
+        # the most active student and the most attempted quiz
+        db = quiz.db
+        user_id = db.session.query(quiz.Scores.user_id).group_by(quiz.Scores.user_id).order_by(db.func.count().desc()).limit(1).scalar()
+        username = db.session.get(quiz.User, user_id).username
+        quiz_id = db.session.query(quiz.Scores.quiz_id).group_by(quiz.Scores.quiz_id).order_by(db.func.count().desc()).limit(1).scalar()
+    print(f"data set: {counts}")
+
+    with_indexes = measure(quiz, app, username, quiz_id, args.repeat)
+    with app.app_context():
+        for name in INDEX_SET:
+            quiz.db.session.execute(quiz.db.text(f"DROP INDEX IF EXISTS {name}"))
+        quiz.db.session.commit()
+    without_indexes = measure(quiz, app, username, quiz_id, args.repeat)
+
+    print(f"mean of {args.repeat} requests through the test client")
+    print(f"{'route':16s} {'without':>10s} {'with':>10s}")
+    for name in with_indexes:
+        print(f"{name:16s} {without_indexes[name] * 1000:8.1f}ms {with_indexes[name] * 1000:8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+"""End-to-end load test over the app's routes.
+
+Drives a weighted mix of student and admin requests (dashboards, search,
+start/submit quiz, scores, summaries, leaderboards) from several threads,
+either through the Flask test client or against a running server, and reports
+throughput, p50/p95/p99 latency and, for the test client, SQL statements per
+route. Results are saved as JSON so runs can be compared over time.
+
+    python bench/load.py --scale 100k --threads 8 --requests 5000
+    python bench/load.py --database /tmp/bench.db --mix exam --baseline bench/results/load-20260101-120000.json
+    python bench/load.py --database /tmp/bench.db --url http://127.0.0.1:5000   # server started on the same file
+
+The test client runs every thread in this process, so it measures the app
+under the GIL the way one threaded worker would. ``--url`` measures whatever
+server is behind it.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+from sqlalchemy import event
+
+from common import ROOT, load_app
+from generate import PASSWORD, SCALES, generate
+
+SEARCH_WORDS = ('algebra', 'motion', 'cells', 'poetry', 'graphs', 'quiz', 'rivers', 'logic')
+
+# name -> (role, method, path and form for one request)
+ROUTES = {
+    'user_dashboard': ('user', 'GET', lambda rng, data: ('/user/dashboard', None)),
+    'view_quiz': ('user', 'GET', lambda rng, data: (f"/view/quiz/{rng.choice(data['quizzes'])}", None)),
+    'start_quiz': ('user', 'GET', lambda rng, data: (f"/start/quiz/{rng.choice(data['quizzes'])}", None)),
+    'submit_quiz': ('user', 'POST', lambda rng, data: submission(rng, data)),
+    'user_scores': ('user', 'GET', lambda rng, data: (f"/user/scores/{rng.choice(data['quizzes'])}", None)),
+    'user_summary': ('user', 'GET', lambda rng, data: ('/user/summary/data', None)),
+    'leaderboard': ('user', 'GET', lambda rng, data: (f"/leaderboard/quiz/{rng.choice(data['quizzes'])}", None)),
+    'lookup': ('admin', 'GET', lambda rng, data: (f"/lookup/quiz?q={rng.choice(SEARCH_WORDS)[:3]}", None)),
+    'admin_dashboard': ('admin', 'GET', lambda rng, data: ('/admin/dashboard', None)),
+    'admin_quiz': ('admin', 'GET', lambda rng, data: ('/admin/quiz', None)),
+    'admin_search': ('admin', 'GET', lambda rng, data: (f"/admin/search/all?search_query={rng.choice(SEARCH_WORDS)}", None)),
+    'admin_summary': ('admin', 'GET', lambda rng, data: ('/admin/summary/data', None)),
+}
+
+# relative weights of each route
+MIXES = {
+    'browse': {'user_dashboard': 25, 'view_quiz': 15, 'start_quiz': 10, 'submit_quiz': 10, 'user_scores': 10, 'user_summary': 10,
+               'leaderboard': 5, 'lookup': 3, 'admin_dashboard': 4, 'admin_quiz': 3, 'admin_search': 3, 'admin_summary': 2},
+    'exam': {'start_quiz': 45, 'submit_quiz': 45, 'user_scores': 5, 'user_dashboard': 5},
+    'admin': {'admin_dashboard': 25, 'admin_quiz': 25, 'admin_search': 25, 'lookup': 15, 'admin_summary': 10},
+}
+
+
+def submission(rng, data):
+    quiz_id = rng.choice(data['quizzes'])
+    return f"/submit/quiz/{quiz_id}", {f"q{question_id}": str(rng.randint(1, 4)) for question_id in data['questions'][quiz_id]}
+
+
+def percentile(samples, p):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class TestClientDriver:
+    """Requests through ``app.test_client()``, SQL statements counted per thread."""
+
+    def __init__(self, quiz, app):
+        self.quiz = quiz
+        self.app = app
+        self.local = threading.local()
+        with app.app_context():
+            event.listen(quiz.db.engine, 'before_cursor_execute', self.count_statement)
+
+    def count_statement(self, *args):
+        self.local.statements = getattr(self.local, 'statements', 0) + 1
+
+    def session(self, role, user):
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user['id']
+            session['username'] = user['username']
+            session['is_admin'] = role == 'admin'
+        return client
+
+    def request(self, client, method, path, form):
+        self.local.statements = 0
+        response = client.open(path, method=method, data=form)
+        return response.status_code, self.local.statements
+
+    def finish(self):
+        with self.app.app_context():
+            self.quiz.submission_queue().flush()
+            return self.quiz.submission_queue().stats()
+
+
+class ServerDriver:
+    """Requests over HTTP to ``--url``, one cookie jar per simulated user."""
+
+    def __init__(self, url, admin_password):
+        self.url = url.rstrip('/')
+        self.admin_password = admin_password
+
+    def session(self, role, user):
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect())
+        password = self.admin_password if role == 'admin' else PASSWORD
+        self.request(opener, 'POST', '/login', {'username': user['username'], 'password': password})
+        return opener
+
+    def request(self, opener, method, path, form):
+        body = urllib.parse.urlencode(form).encode() if form is not None else None
+        try:
+            with opener.open(urllib.request.Request(self.url + path, data=body, method=method), timeout=60) as response:
+                response.read()
+                return response.status, None
+        except urllib.error.HTTPError as error:
+            return error.code, None
+
+    def finish(self):
+        return None
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def load_data(quiz, app):
+    with app.app_context():
+        db = quiz.db
+        questions = {}
+        for question_id, quiz_id in db.session.query(quiz.Question.id, quiz.Question.quiz_id):
+            questions.setdefault(quiz_id, []).append(question_id)
+        users = [dict(id=user_id, username=username) for user_id, username in
+                 db.session.query(quiz.User.id, quiz.User.username).filter(quiz.User.is_admin == 0, quiz.User.username.like('%@bench'))]
+        admin = db.session.query(quiz.User.id, quiz.User.username).filter(quiz.User.is_admin == 1).first()
+        counts = {model.__tablename__: db.session.query(db.func.count(model.id)).scalar()
+                  for model in (quiz.User, quiz.Subject, quiz.Chapter, quiz.Quiz, quiz.Question, quiz.Scores)}
+    if not users or not questions:
+        raise SystemExit("no generated data in this database, run bench/generate.py first or pass --scale")
+    return {'quizzes': sorted(questions), 'questions': questions, 'users': users,
+            'admin': dict(id=admin[0], username=admin[1]), 'counts': counts}
+
+
+def run(driver, data, mix, threads, requests, warmup, seed):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    ticket = itertools.count()
+    samples = {name: [] for name in names}
+    statements = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    lock = threading.Lock()
+    start = threading.Barrier(threads + 1)
+
+    def worker(number):
+        rng = random.Random(seed * 1000 + number)
+        user = rng.choice(data['users'])
+        clients = {'user': driver.session('user', user), 'admin': driver.session('admin', data['admin'])}
+        start.wait()
+        while True:
+            position = next(ticket)
+            if position >= warmup + requests:
+                return
+            name = rng.choices(names, weights)[0]
+            role, method, build = ROUTES[name]
+            path, form = build(rng, data)
+            started = time.perf_counter()
+            status, count = driver.request(clients[role], method, path, form)
+            elapsed = (time.perf_counter() - started) * 1000
+            if position < warmup:
+                continue
+            with lock:
+                samples[name].append(elapsed)
+                if count is not None:
+                    statements[name].append(count)
+                if status >= 400:
+                    errors[name] += 1
+
+    workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    routes = {}
+    for name in names:
+        if not samples[name]:
+            continue
+        routes[name] = {
+            'requests': len(samples[name]),
+            'errors': errors[name],
+            'throughput': round(len(samples[name]) / elapsed, 1),
+            'p50_ms': round(percentile(samples[name], 50), 2),
+            'p95_ms': round(percentile(samples[name], 95), 2),
+            'p99_ms': round(percentile(samples[name], 99), 2),
+            'max_ms': round(max(samples[name]), 2),
+            'sql_mean': round(sum(statements[name]) / len(statements[name]), 1) if statements[name] else None,
+            'sql_max': max(statements[name]) if statements[name] else None,
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return {'elapsed_s': round(elapsed, 2), 'requests': total, 'throughput': round(total / elapsed, 1), 'routes': routes}
+
+
+def report(result, baseline=None):
+    print(f"{result['requests']} requests in {result['elapsed_s']}s -> {result['throughput']} req/s")
+    print(f"{'route':16s} {'reqs':>6s} {'err':>4s} {'req/s':>8s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'sql':>6s}" + ('  p95 vs baseline' if baseline else ''))
+    for name, route in result['routes'].items():
+        line = (f"{name:16s} {route['requests']:6d} {route['errors']:4d} {route['throughput']:8.1f} {route['p50_ms']:8.2f} "
+                f"{route['p95_ms']:8.2f} {route['p99_ms']:8.2f} {route['sql_mean'] if route['sql_mean'] is not None else '-':>6}")
+        before = baseline['result']['routes'].get(name) if baseline else None
+        if before:
+            line += f"  {(route['p95_ms'] - before['p95_ms']) / before['p95_ms']:+.0%} ({before['p95_ms']:.2f})"
+        print(line)
+    if result.get('submission_queue'):
+        print(f"submission queue: {result['submission_queue']}")
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', help='SQLite file made by generate.py, by default a fresh one is generated')
+    parser.add_argument('--scale', choices=SCALES, default='10k', help='size of the generated data when --database is not given')
+    parser.add_argument('--scores', type=int, help='exact number of generated scores, overrides --scale')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mix', choices=MIXES, default='browse')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=100, help='requests sent before measuring starts')
+    parser.add_argument('--url', help='drive a running server instead of the test client')
+    parser.add_argument('--admin-password', default='admin123', help='password of the seeded admin, for --url')
+    parser.add_argument('--output', help='where to save the JSON results, default bench/results/load-<time>.json')
+    parser.add_argument('--baseline', help='earlier results file to compare p95 latency against')
+    args = parser.parse_args()
+
+    database = args.database or os.path.join(tempfile.mkdtemp(), 'load.db')
+    quiz, app = load_app(f"sqlite:///{os.path.abspath(database)}")
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    if not args.database:
+        with app.app_context():
+            generate(quiz, args.scores or SCALES[args.scale], args.seed)
+    data = load_data(quiz, app)
+
+    driver = ServerDriver(args.url, args.admin_password) if args.url else TestClientDriver(quiz, app)
+    result = run(driver, data, MIXES[args.mix], args.threads, args.requests, args.warmup, args.seed)
+    result['submission_queue'] = driver.finish()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+    report(result, baseline)
+
+    output = args.output or os.path.join(ROOT, 'bench', 'results', time.strftime('load-%Y%m%d-%H%M%S.json'))
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as handle:
+        json.dump({
+            'when': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'driver': 'server' if args.url else 'test client',
+            'url': args.url,
+            'database': database,
+            'rows': data['counts'],
+            'mix': args.mix,
+            'threads': args.threads,
+            'seed': args.seed,
+            'result': result,
+        }, handle, indent=2)
+    print(f"saved {output}")
+
+
+if __name__ == '__main__':
+    main()
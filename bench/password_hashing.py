@@ -0,0 +1,54 @@
+"""Registration and login throughput through the password hashing pool.
+
+Registers and then logs in ``--users`` accounts from ``--threads`` client
+threads at once, and reports requests per second and how many were turned
+away as busy.
+
+    python bench/password_hashing.py --users 200 --threads 8
+    python bench/password_hashing.py --method pbkdf2:sha256:600000 --workers 4
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import load_app
+
+
+def run(client_factory, requests, threads):
+    # (seconds, redirect locations) for posting every (url, form) in requests
+    def post(item):
+        url, form = item
+        return client_factory().post(url, data=form).location
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        locations = list(pool.map(post, requests))
+    return time.perf_counter() - started, locations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--method', default='scrypt:32768:8:1')
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    database_uri = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'passwords.db')}"
+    quiz, app = load_app(database_uri, PASSWORD_HASH_METHOD=args.method, PASSWORD_HASH_WORKERS=args.workers)
+    client_factory = app.test_client
+
+    registrations = [('/register', {'username': f'user{n}@bench', 'password': f'secret{n}', 'name': 'Bench',
+                                    'qualification': '-', 'dob': '2000-01-01'}) for n in range(args.users)]
+    logins = [('/login', {'username': f'user{n}@bench', 'password': f'secret{n}'}) for n in range(args.users)]
+
+    print(f"{args.method}, {args.workers} hashing workers, {args.threads} client threads")
+    for label, requests, success in (('register', registrations, '/login'), ('login', logins, '/user/dashboard')):
+        seconds, locations = run(client_factory, requests, args.threads)
+        ok = sum(1 for location in locations if location == success)
+        print(f"{label:8s} {ok}/{len(requests)} ok in {seconds:.2f}s -> {len(requests) / seconds:.1f}/s")
+
+
+if __name__ == '__main__':
+    main()
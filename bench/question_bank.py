@@ -0,0 +1,142 @@
+"""Per-attempt papers drawn from a large chapter question bank.
+
+Builds a chapter with a bank of ``--bank`` questions and a quiz that draws
+``--paper`` of them per attempt, then starts attempts from several worker
+processes with several threads each, like a class all pressing Start at once.
+Every attempt is also submitted so the paper round trip through the session
+is exercised. Reports starts per second and start latency percentiles, next
+to the time ``ORDER BY RANDOM()`` takes to draw the same paper.
+
+    python bench/question_bank.py --bank 100000 --paper 20 --workers 4 --threads 50 --starts 10
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import date
+
+from common import load_app
+from generate import CHUNK
+
+
+def setup(database_uri, bank, paper, users):
+    quiz, app = load_app(database_uri)
+    with app.app_context():
+        db = quiz.db
+        subject = quiz.Subject(name='Bank test')
+        db.session.add(subject)
+        db.session.flush()
+        chapter = quiz.Chapter(name='Bank test', questions_count=paper, subject_id=subject.id)
+        db.session.add(chapter)
+        db.session.flush()
+        # the bank is written by a plain quiz in the chapter, the bank quiz itself has no questions of its own
+        source = quiz.Quiz(quiz_name='Bank source', duration=10, chapter_id=chapter.id, subject_id=subject.id)
+        drawn = quiz.Quiz(quiz_name='Bank test', duration=10, chapter_id=chapter.id, subject_id=subject.id, from_bank=True)
+        db.session.add_all([source, drawn])
+        db.session.flush()
+        for start in range(0, bank, CHUNK):
+            db.session.execute(quiz.insert(quiz.Question), [
+                dict(quiz_id=source.id, chapter_id=chapter.id, title=f'Q{number}', question=f'Question {number}?',
+                     option1='a', option2='b', option3='c', option4='d', correct=number % 4 + 1)
+                for number in range(start, min(start + CHUNK, bank))])
+        db.session.execute(quiz.insert(quiz.User), [
+            dict(username=f'bank{number}@test', password='x', name='Bank', qualification='-', dob=date(2000, 1, 1))
+            for number in range(users)])
+        quiz.catalog_changed()
+        db.session.commit()
+        user_ids = [row[0] for row in db.session.query(quiz.User.id).filter(quiz.User.username.like('bank%@test'))]
+
+        # what the draw replaces, for reference
+        timings = []
+        for _ in range(5):
+            started = time.perf_counter()
+            db.session.query(quiz.Question.id).filter(quiz.Question.chapter_id == chapter.id).order_by(db.func.random()).limit(paper).all()
+            timings.append(time.perf_counter() - started)
+        return drawn.id, user_ids, min(timings)
+
+
+def worker(database_uri, quiz_id, user_ids, threads, starts, paper, start, results):
+    quiz, app = load_app(database_uri)
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    latencies, failures = [], []
+
+    def attempts(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+        start.wait()
+        for _ in range(starts):
+            started = time.perf_counter()
+            response = client.get(f'/start/quiz/{quiz_id}')
+            latencies.append(time.perf_counter() - started)
+            questions = re.findall(rb'name = "q(\d+)" value = "1"', response.data)
+            if response.status_code != 200 or len(set(questions)) != paper:
+                failures.append('start')
+                continue
+            answers = {f'q{question_id.decode()}': '1' for question_id in set(questions)}
+            if client.post(f'/submit/quiz/{quiz_id}', data=answers).status_code != 302:
+                failures.append('submit')
+
+    pool = [threading.Thread(target=attempts, args=(user_ids[number % len(user_ids)],)) for number in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    with app.app_context():
+        quiz.submission_queue().flush()
+        banks = quiz.question_banks().stats()
+        dropped = quiz.submission_queue().stats()['failed']
+    results.put((latencies, failures, banks['misses'], dropped))
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))] if samples else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bank', type=int, default=100000, help='questions in the chapter bank')
+    parser.add_argument('--paper', type=int, default=20, help='questions drawn per attempt')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=50, help='concurrent students per worker')
+    parser.add_argument('--starts', type=int, default=10, help='attempts per student')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database_uri = f"sqlite:///{os.path.join(directory, 'bank.db')}"
+    started = time.perf_counter()
+    quiz_id, user_ids, order_by_random = setup(database_uri, args.bank, args.paper, args.workers * args.threads)
+    print(f"bank of {args.bank} questions built in {time.perf_counter() - started:.1f}s")
+
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(database_uri, quiz_id, user_ids[number::args.workers], args.threads,
+                                                              args.starts, args.paper, start, results))
+                 for number in range(args.workers)]
+    for process in processes:
+        process.start()
+    time.sleep(2)
+    started = time.perf_counter()
+    start.set()
+    totals = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+
+    latencies = [latency for result in totals for latency in result[0]]
+    failures = [failure for result in totals for failure in result[1]]
+    loads = sum(result[2] for result in totals)
+    dropped = sum(result[3] for result in totals)
+    print(f"{args.workers} workers x {args.threads} threads, {len(latencies)} starts (each submitted) in {elapsed:.2f}s "
+          f"-> {len(latencies) / elapsed:.0f} start+submit/s, {len(failures)} failed, {dropped} submissions dropped, bank loaded {loads} times")
+    print(f"start latency p50 {percentile(latencies, 50) * 1000:.1f}ms  p95 {percentile(latencies, 95) * 1000:.1f}ms  "
+          f"p99 {percentile(latencies, 99) * 1000:.1f}ms")
+    print(f"ORDER BY RANDOM() LIMIT {args.paper} over the bank: {order_by_random * 1000:.1f}ms per draw")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Process startup time: importing the app module and building the app.
+
+Each sample runs in a fresh interpreter, the way a pre-fork server boots a
+worker, and the medians are reported. ``init-db`` is timed separately since
+it is meant to run once per deploy, not once per worker.
+
+    python bench/startup.py --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from common import ROOT
+
+SAMPLE = '''
+import os, sys, time
+sys.path.insert(0, {bench!r})
+started = time.perf_counter()
+from common import import_quiz
+quiz = import_quiz()
+imported = time.perf_counter()
+app = quiz.create_app({{'SQLALCHEMY_DATABASE_URI': {database_uri!r}}})
+created = time.perf_counter()
+client = app.test_client()
+client.get('/login')
+first_request = time.perf_counter()
+if {init_db!r}:
+    with app.app_context():
+        quiz.init_database()
+print(imported - started, created - imported, first_request - created, time.perf_counter() - first_request)
+'''
+
+
+def sample(database_uri, init_db=False):
+    code = SAMPLE.format(bench=os.path.join(ROOT, 'bench'), database_uri=database_uri, init_db=init_db)
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return [float(value) for value in output.split()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    database_uri = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'startup.db')}"
+    init_db = sample(database_uri, init_db=True)[3]
+    samples = [sample(database_uri) for _ in range(args.runs)]
+    for index, label in enumerate(('import', 'create_app', 'first request')):
+        print(f"{label:14s} {statistics.median(row[index] for row in samples) * 1000:8.1f} ms")
+    print(f"{'init-db':14s} {init_db * 1000:8.1f} ms (once per deploy)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,134 @@
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, session, url_for, flash
+import atexit
+import csv
+import io
+import json
+import os
+import queue
+import random
+import sqlite3
+import sys
+import time
+import zlib
+from array import array
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache, wraps
+from operator import eq
+from threading import BoundedSemaphore, Lock, Thread, get_ident
+from flask import Flask, abort, before_render_template, template_rendered, current_app, make_response, render_template, request, redirect, session, url_for, flash, g, has_request_context, jsonify, Response, stream_with_context
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import or_
-
-app = Flask(__name__)
-# Set the secret key to a random value
-app.secret_key = "SECRET KEY"
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///Quizblitz.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
+import click
+from sqlalchemy import or_, event, insert, update, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import selectinload, joinedload, contains_eager
+
+#application
+#nothing here touches the database at import, create_app() builds a configured app and
+#'flask init-db' (or running this file) migrates the schema and seeds the admin
 db = SQLAlchemy()
-db.init_app(app)
+
+# routes and CLI commands are collected here and attached to each app create_app() builds
+views = []
+commands = []
+
+def route(rule, **options):
+    def decorator(view):
+        views.append((rule, view, options))
+        return view
+    return decorator
+
+def command(name):
+    def decorator(function):
+        cli_command = click.command(name)(with_appcontext(function))
+        commands.append(cli_command)
+        return cli_command
+    return decorator
+
+SQLITE_JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SQLITE_SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+def engine_options(config):
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    if ':memory:' not in config['SQLALCHEMY_DATABASE_URI'] and config['SQLALCHEMY_DATABASE_URI'] != 'sqlite://':
+        options.setdefault('pool_size', config['DB_POOL_SIZE'])
+        options.setdefault('max_overflow', config['DB_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+        options.setdefault('pool_recycle', config['DB_POOL_RECYCLE'])
+    if not config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        options.setdefault('pool_pre_ping', True)
+    return options
+
+def configure_sqlite(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    journal_mode = str(current_app.config['SQLITE_JOURNAL_MODE']).upper()
+    synchronous = str(current_app.config['SQLITE_SYNCHRONOUS']).upper()
+    if journal_mode not in SQLITE_JOURNAL_MODES or synchronous not in SQLITE_SYNCHRONOUS_LEVELS:
+        raise ValueError(f"Bad SQLite settings: journal mode {journal_mode}, synchronous {synchronous}")
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {int(current_app.config['SQLITE_BUSY_TIMEOUT'])}")
+    cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+    cursor.execute(f"PRAGMA synchronous = {synchronous}")
+    # off by default in SQLite, without it the ondelete clauses on the models are never applied
+    cursor.execute("PRAGMA foreign_keys = ON")
+    cursor.close()
+
+#credentials
+#hashing runs on a small thread pool so a burst of signups uses at most PASSWORD_HASH_WORKERS cores,
+#requests past the queue limit are turned away instead of piling up behind it
+class PasswordPoolBusy(Exception):
+    pass
+
+password_pool = None
+password_pool_pid = None
+password_pool_lock = Lock()
+
+def run_hashing(function, *args):
+    global password_pool, password_pool_pid
+    if not has_request_context():
+        # seeding and CLI commands hash inline
+        return function(*args)
+    with password_pool_lock:
+        if password_pool_pid != os.getpid():
+            # a forked worker gets its own threads, made once however many requests arrive first
+            password_pool = ThreadPoolExecutor(max_workers=current_app.config['PASSWORD_HASH_WORKERS'], thread_name_prefix='password')
+            password_pool_pid = os.getpid()
+    password_slots = current_app.extensions['password_slots']
+    if not password_slots.acquire(blocking=False):
+        raise PasswordPoolBusy()
+    try:
+        return password_pool.submit(function, *args).result()
+    finally:
+        password_slots.release()
+
+def hash_password(password):
+    return run_hashing(generate_password_hash, password, current_app.config['PASSWORD_HASH_METHOD'])
+
+def verify_password(password_hash, password):
+    return run_hashing(check_password_hash, password_hash, password)
+
+@lru_cache(maxsize=None)
+def stored_hash_method(method):
+    # werkzeug writes the method with its defaults filled in ('scrypt' is stored as 'scrypt:32768:8:1'), hashed once per process
+    return generate_password_hash('', method).split('$', 1)[0]
+
+def password_needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != stored_hash_method(current_app.config['PASSWORD_HASH_METHOD'])
 
 
 #Models
 class User(db.Model):
     __tablename__ = "user"
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(150), nullable = False)
+    username = db.Column(db.String(150), nullable = False, unique = True, index = True)
     name = db.Column(db.String(50), nullable = False)
-    password = db.Column(db.String(100), nullable = False)
+    password = db.Column(db.String(255), nullable = False)
     qualification = db.Column(db.String(80), nullable = False)
     dob = db.Column(db.Date, nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
@@ -34,10 +142,10 @@ class User(db.Model):
         self.set_password(password)
 
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return verify_password(self.password, password)
 
 class Subject(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -50,7 +158,7 @@ class Chapter(db.Model):
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     questions_count = db.Column(db.Integer,nullable = False)
-    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id', ondelete='CASCADE'), nullable=True, index=True)
     questions = db.relationship('Question', back_populates="chapter")
 
 class Quiz(db.Model):
@@ -59,14 +167,21 @@ class Quiz(db.Model):
     quiz_name = db.Column(db.String(50), nullable = True)
     duration = db.Column(db.Integer, nullable=False)
     score = db.Column(db.Integer)
-    chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id'), nullable=True)
-    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=True)
+    # bumped whenever the quiz or its questions change, cached question sets carry the version they were built from
+    content_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # set when the quiz is soft-deleted, it is hidden from then on and purged in the background
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    # each attempt gets chapter.questions_count questions drawn from the chapter's bank instead of the quiz's own list
+    from_bank = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+    chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id', ondelete='CASCADE'), nullable=True, index=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id', ondelete='CASCADE'), nullable=True, index=True)
     subject = db.relationship('Subject',back_populates = "quiz")
     questions = db.relationship('Question', back_populates ='quiz')
     chapter = db.relationship('Chapter', backref = "quizzes")
 
-    def __init__(self, quiz_name, duration, chapter_id, score=0, subject_id= None):
+    def __init__(self, quiz_name, duration, chapter_id, score=0, subject_id= None, from_bank = False):
         self.score = score
+        self.from_bank = from_bank
         self.quiz_name = quiz_name
         self.duration = duration
         self.chapter_id = chapter_id
@@ -74,7 +189,7 @@ class Quiz(db.Model):
 
 class Question(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=False)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'), nullable=False, index=True)
     title = db.Column(db.String(100), nullable=False)
     question = db.Column(db.Text,nullable=False)
     option1 = db.Column(db.String(100), nullable=False)
@@ -85,7 +200,7 @@ class Question(db.Model):
 
     quiz = db.relationship('Quiz', back_populates = "questions")
     chapter = db.relationship('Chapter',back_populates = "questions")
-    chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id'),nullable=True)
+    chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id', ondelete='SET NULL'),nullable=True, index=True)
 
 class Scores(db.Model):
     __tablename__ = "scores"
@@ -93,46 +208,1801 @@ class Scores(db.Model):
     score = db.Column(db.Integer, nullable = False)
     total = db.Column(db.Integer, nullable = False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable = False)
-    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable = False)
-    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable = True)
-    chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id'), nullable = True)
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id', ondelete='CASCADE'), nullable = False, index = True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id', ondelete='SET NULL'), nullable = True, index = True)
+    chapter_id = db.Column(db.Integer, db.ForeignKey('chapter.id', ondelete='SET NULL'), nullable = True, index = True)
+    # JSON {question_id: choice} of what was submitted, kept so the attempt can be regraded
+    answers = db.Column(db.Text, nullable = True)
+    created_at = db.Column(db.DateTime, nullable = True, default = datetime.utcnow, index = True)
 
     subject = db.relationship('Subject',backref = 'scores')
     user = db.relationship('User', backref='scores')
     quiz = db.relationship('Quiz', backref='scores')
     chapter = db.relationship('Chapter', backref = 'scores')
 
-    def __init__(self, score, total, user_id, quiz_id, subject_id, chapter_id):
+    __table_args__ = (db.Index('ix_scores_user_quiz', 'user_id', 'quiz_id'),)
+
+    def __init__(self, score, total, user_id, quiz_id, subject_id, chapter_id, answers = None):
         self.score = score
         self.total = total
         self.user_id = user_id
         self.quiz_id = quiz_id
         self.subject_id = subject_id
         self.chapter_id = chapter_id
+        self.answers = answers
 
-with app.app_context():
-    db.create_all()
+class AttemptRollup(db.Model):
+    #running totals of Scores per user, quiz, chapter and subject
+    __tablename__ = "attempt_rollup"
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(10), nullable = False)
+    scope_id = db.Column(db.Integer, nullable = False)
+    attempts = db.Column(db.Integer, nullable = False, default = 0)
+    score_sum = db.Column(db.Integer, nullable = False, default = 0)
+    best_score = db.Column(db.Integer, nullable = False, default = 0)
 
-    # Check if an admin user already exists
-    admin = User.query.filter_by(is_admin=True).first()
+    __table_args__ = (db.UniqueConstraint('scope', 'scope_id'),)
+
+class CatalogState(db.Model):
+    #a single row bumped whenever subjects, chapters, quizzes or questions change, cached pages are checked against it
+    __tablename__ = "catalog_state"
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable = False, default = 0)
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow)
+
+class SchemaVersion(db.Model):
+    #one row per migration applied to this database
+    __tablename__ = "schema_version"
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    applied_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow)
+
+class UserRollup(db.Model):
+    #running totals of one user's Scores per subject, per chapter and per day
+    __tablename__ = "user_rollup"
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable = False)
+    scope = db.Column(db.String(10), nullable = False)
+    scope_key = db.Column(db.String(20), nullable = False)
+    attempts = db.Column(db.Integer, nullable = False, default = 0)
+    score_sum = db.Column(db.Integer, nullable = False, default = 0)
+    total_sum = db.Column(db.Integer, nullable = False, default = 0)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'scope', 'scope_key'),)
 
-    admin_user = User(
-        username="quizmaster@gmail.com",
-        name="Quiz Master",  # Add a valid name here
-        password=generate_password_hash("admin123"),
-        qualification="Admin",
-        dob=datetime.strptime("2000-01-01", '%Y-%m-%d').date(),
-        is_admin=True
+class LeaderboardEntry(db.Model):
+    #a user's points on one board, best score for a quiz board and the sum of best quiz scores for chapters and subjects
+    __tablename__ = "leaderboard"
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(10), nullable = False)
+    scope_id = db.Column(db.Integer, nullable = False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable = False)
+    points = db.Column(db.Integer, nullable = False, default = 0)
+    reached_at = db.Column(db.DateTime, nullable = False, default = datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'scope_id', 'user_id'),
+        db.Index('ix_leaderboard_rank', 'scope', 'scope_id', points.desc(), 'reached_at'),
     )
-    db.session.add(admin_user)
+
+class LeaderboardBucket(db.Model):
+    #how many users on a board hold each points value, a rank is one plus the users above
+    __tablename__ = "leaderboard_bucket"
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(10), nullable = False)
+    scope_id = db.Column(db.Integer, nullable = False)
+    points = db.Column(db.Integer, nullable = False)
+    users = db.Column(db.Integer, nullable = False, default = 0)
+
+    __table_args__ = (db.UniqueConstraint('scope', 'scope_id', 'points'),)
+
+ROLLUP_SCOPES = {
+    'user': Scores.user_id,
+    'quiz': Scores.quiz_id,
+    'chapter': Scores.chapter_id,
+    'subject': Scores.subject_id,
+}
+
+#query budget
+#every SQL statement run while handling a request is counted in g.query_count,
+#routes declare how many they are allowed with @query_budget(n)
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+def query_budget(limit):
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+def check_query_budget(response):
+    view = current_app.view_functions.get(request.endpoint)
+    limit = getattr(view, 'query_budget', None)
+    used = g.get('query_count', 0)
+    if limit is not None and used > limit:
+        message = f"{request.endpoint} ran {used} queries, budget is {limit}"
+        # while testing an over-budget route is an error so the N+1 can't come back quietly
+        if current_app.testing:
+            raise AssertionError(message)
+        current_app.logger.warning(message)
+    return response
+
+
+#metrics
+#per route latency histograms plus SQL and template time for every request, served as Prometheus text
+#from /metrics, each worker process reports its own numbers
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and conn.info.get('query_started'):
+        g.sql_seconds = g.get('sql_seconds', 0.0) + time.perf_counter() - conn.info['query_started'].pop()
+
+def start_render_timer(sender, template, context, **extra):
+    if has_request_context():
+        g.render_started = time.perf_counter()
+
+def stop_render_timer(sender, template, context, **extra):
+    if has_request_context() and 'render_started' in g:
+        g.render_seconds = g.get('render_seconds', 0.0) + time.perf_counter() - g.pop('render_started')
+
+class RequestMetrics:
+    def __init__(self):
+        self.lock = Lock()
+        self.routes = {}
+        self.statuses = {}
+
+    def observe(self, route, status, seconds, statements, sql_seconds, render_seconds):
+        with self.lock:
+            metrics = self.routes.get(route)
+            if not metrics:
+                metrics = self.routes[route] = {'buckets': [0] * len(METRIC_BUCKETS), 'count': 0, 'sum': 0.0,
+                                                'statements': 0, 'sql_seconds': 0.0, 'render_seconds': 0.0}
+            for index, bound in enumerate(METRIC_BUCKETS):
+                if seconds <= bound:
+                    metrics['buckets'][index] += 1
+                    break
+            metrics['count'] += 1
+            metrics['sum'] += seconds
+            metrics['statements'] += statements
+            metrics['sql_seconds'] += sql_seconds
+            metrics['render_seconds'] += render_seconds
+            self.statuses[(route, status)] = self.statuses.get((route, status), 0) + 1
+
+    def exposition(self):
+        lines = [
+            "# HELP quizblitz_request_seconds Time to build a response, by route.",
+            "# TYPE quizblitz_request_seconds histogram",
+        ]
+        with self.lock:
+            routes = {route: dict(metrics, buckets=list(metrics['buckets'])) for route, metrics in sorted(self.routes.items())}
+            statuses = sorted(self.statuses.items())
+        for route, metrics in routes.items():
+            cumulative = 0
+            for bound, count in zip(METRIC_BUCKETS, metrics['buckets']):
+                cumulative += count
+                lines.append(f'quizblitz_request_seconds_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+            lines.append(f'quizblitz_request_seconds_bucket{{route="{route}",le="+Inf"}} {metrics["count"]}')
+            lines.append(f'quizblitz_request_seconds_sum{{route="{route}"}} {metrics["sum"]:.6f}')
+            lines.append(f'quizblitz_request_seconds_count{{route="{route}"}} {metrics["count"]}')
+        lines += ["# HELP quizblitz_requests_total Responses sent, by route and status.", "# TYPE quizblitz_requests_total counter"]
+        lines += [f'quizblitz_requests_total{{route="{route}",status="{status}"}} {count}' for (route, status), count in statuses]
+        for name, key, help_text in (
+            ('quizblitz_sql_statements_total', 'statements', "SQL statements run while handling requests, by route."),
+            ('quizblitz_sql_seconds_total', 'sql_seconds', "Time spent in SQL statements, by route."),
+            ('quizblitz_render_seconds_total', 'render_seconds', "Time spent rendering templates, by route."),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{route="{route}"}} {round(metrics[key], 6)}' for route, metrics in routes.items()]
+        return lines
+
+#sampling profiler, off unless PROFILE_SLOW_REQUEST_MS is set: while a request runs its thread's stack is
+#sampled every PROFILE_SAMPLE_INTERVAL seconds, requests slower than the threshold are written out as
+#folded stacks that flamegraph.pl or speedscope read directly
+class SlowRequestProfiler:
+    def __init__(self, threshold_ms, interval, directory):
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.directory = directory
+        self.lock = Lock()
+        self.active = {}
+        self.pid = None
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, stacks in self.active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stack = self.fold(frame)
+                        stacks[stack] = stacks.get(stack, 0) + 1
+
+    @staticmethod
+    def fold(frame):
+        names = []
+        while frame is not None:
+            names.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def begin(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                # a forked worker gets its own sampler
+                Thread(target=self.run, name='profiler', daemon=True).start()
+                self.pid = os.getpid()
+            self.active[get_ident()] = {}
+
+    def end(self, route, seconds):
+        with self.lock:
+            stacks = self.active.pop(get_ident(), None)
+        if not stacks or seconds * 1000 < self.threshold_ms:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}.{time.time_ns() // 1000 % 1000000:06d}-{route}-{int(seconds * 1000)}ms.folded")
+        with open(path, 'w') as profile:
+            profile.writelines(f"{stack} {count}\n" for stack, count in stacks.items())
+        current_app.logger.info("Slow request %s took %.0f ms, profile written to %s", route, seconds * 1000, path)
+
+def request_metrics():
+    return current_app.extensions['request_metrics']
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    profiler = current_app.extensions['profiler']
+    if profiler:
+        profiler.begin()
+        g.profiling = True
+
+def record_request_metrics(response):
+    if 'request_started' in g:
+        request_metrics().observe(request.endpoint or 'unmatched', response.status_code, time.perf_counter() - g.request_started,
+                                  g.get('query_count', 0), g.get('sql_seconds', 0.0), g.get('render_seconds', 0.0))
+    return response
+
+def finish_request_profile(error=None):
+    if g.get('profiling'):
+        current_app.extensions['profiler'].end(request.endpoint or 'unmatched', time.perf_counter() - g.request_started)
+
+@route("/metrics")
+def metrics():
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return Response("forbidden\n", status = 403, mimetype = "text/plain")
+    lines = request_metrics().exposition()
+    submissions = submission_queue().stats()
+    questions = question_cache().stats()
+    gauges = {
+        'submission_queue_depth': ('gauge', submissions['depth']),
+        'submission_queue_rows_total': ('counter', submissions['rows']),
+        'submission_queue_flushes_total': ('counter', submissions['flushes']),
+        'submission_queue_rejected_total': ('counter', submissions['rejected']),
+        'submission_queue_last_flush_seconds': ('gauge', submissions['last_flush_ms'] / 1000),
+        'question_cache_hits_total': ('counter', questions['hits']),
+        'question_cache_misses_total': ('counter', questions['misses']),
+    }
+    for name, (kind, value) in gauges.items():
+        lines += [f"# TYPE quizblitz_{name} {kind}", f"quizblitz_{name} {value}"]
+    return Response("\n".join(lines) + "\n", mimetype = "text/plain; version=0.0.4")
+
+
+#query layer
+def load_subject_tree(cursor=None):
+    # a page of subjects and all their chapters in two statements
+    return paginate(Subject.query.options(selectinload(Subject.chapters)), Subject.id, cursor)
+
+def load_question_counts(quiz_ids=None):
+    # {quiz_id: number of questions} without loading the Question rows
+    query = db.session.query(Question.quiz_id, db.func.count(Question.id)).group_by(Question.quiz_id)
+    if quiz_ids is not None:
+        query = query.filter(Question.quiz_id.in_(quiz_ids))
+    rows = query.all()
+    return {quiz_id: count for quiz_id, count in rows}
+
+def load_user_scores(user_id, cursor=None):
+    # a page of a user's scores with their quiz joined in
+    return paginate(Scores.query.join(Scores.quiz).options(contains_eager(Scores.quiz)).filter(
+        Scores.user_id == user_id, Quiz.deleted_at.is_(None)), Scores.id, cursor)
+
+def live_quiz(quiz_id):
+    # a quiz students can still see, 404 once it is deleted
+    quiz = db.session.get(Quiz, quiz_id)
+    if quiz is None or quiz.deleted_at is not None:
+        abort(404)
+    return quiz
+
+def attempted_quiz_ids(user_id):
+    # select of the quiz ids a user has a score for, served by ix_scores_user_quiz
+    return db.select(Scores.quiz_id).where(Scores.user_id == user_id).distinct()
+
+
+#pagination
+#list views page by primary key (seek instead of OFFSET), the cursor in the url is an opaque
+#token holding the direction and the id to continue from
+PAGE_SIZE = 25
+Page = namedtuple('Page', 'items next_cursor prev_cursor')
+
+def encode_cursor(direction, key):
+    return urlsafe_b64encode(json.dumps([direction, key]).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    # (direction, id), (None, None) for the first page or a token that doesn't decode
+    if not cursor:
+        return None, None
+    try:
+        direction, key = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None, None
+    # ids are SQLite integers, a key outside 64 bits can't be bound as a parameter
+    if direction not in ('after', 'before') or type(key) is not int or not -2**63 <= key < 2**63:
+        return None, None
+    return direction, key
+
+def paginate(query, column, cursor=None, size=PAGE_SIZE):
+    direction, key = decode_cursor(cursor)
+    if direction == 'before':
+        items = query.filter(column < key).order_by(column.desc()).limit(size + 1).all()
+        has_more = len(items) > size
+        items = items[:size][::-1]
+        next_cursor = encode_cursor('after', getattr(items[-1], column.key)) if items else None
+        prev_cursor = encode_cursor('before', getattr(items[0], column.key)) if has_more else None
+    else:
+        if direction == 'after':
+            query = query.filter(column > key)
+        items = query.order_by(column).limit(size + 1).all()
+        has_more = len(items) > size
+        items = items[:size]
+        next_cursor = encode_cursor('after', getattr(items[-1], column.key)) if has_more else None
+        prev_cursor = encode_cursor('before', getattr(items[0], column.key)) if direction and items else None
+    return Page(items, next_cursor, prev_cursor)
+
+def page_url(param, cursor):
+    # the current page's url with one cursor swapped, other cursors in the query string are kept
+    args = request.args.to_dict()
+    args[param] = cursor
+    return url_for(request.endpoint, **request.view_args, **args)
+
+LOOKUP_MODELS = {'subject': (Subject, Subject.name), 'chapter': (Chapter, Chapter.name), 'quiz': (Quiz, Quiz.quiz_name)}
+LOOKUP_LIMIT = 20
+
+def lookup_query(model, name):
+    query = db.session.query(model.id, name)
+    return query.filter(Quiz.deleted_at.is_(None)) if model is Quiz else query
+
+def lookup_options(kind, search_query='', selected_id=None):
+    # (id, name) pairs for a picker, the best matches for what was typed or the first few rows
+    model, name = LOOKUP_MODELS[kind]
+    if search_query.strip():
+        hits, has_next = search_catalog(search_query, kind=kind, per_page=LOOKUP_LIMIT)
+        ids = [ref_id for hit_kind, ref_id in hits]
+        names = dict(lookup_query(model, name).filter(model.id.in_(ids)).all()) if ids else {}
+        options = [(ref_id, names[ref_id]) for ref_id in ids if ref_id in names]
+    else:
+        options = lookup_query(model, name).order_by(model.id).limit(LOOKUP_LIMIT).all()
+    if selected_id and selected_id not in [option[0] for option in options]:
+        options = db.session.query(model.id, name).filter(model.id == selected_id).all() + list(options)
+    return [(option[0], option[1]) for option in options]
+
+
+#question cache
+#the question list and answer key of a quiz, kept per worker and reused while quiz.content_version is unchanged
+class QuestionCache:
+    def __init__(self, max_questions):
+        self.max_questions = max_questions
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, quiz):
+        # (questions, answer_key) for a quiz, questions are dicts ready for start_quiz.html
+        with self.lock:
+            entry = self.entries.get(quiz.id)
+            if entry and entry[0] == quiz.content_version:
+                self.entries.move_to_end(quiz.id)
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+
+        rows = Question.query.filter_by(quiz_id = quiz.id).order_by(Question.id).all()
+        questions = [
+            {'id': q.id, 'title': q.title, 'question': q.question,
+             'option1': q.option1, 'option2': q.option2, 'option3': q.option3, 'option4': q.option4}
+            for q in rows
+        ]
+        answer_key = {q.id: q.correct for q in rows}
+
+        with self.lock:
+            self._drop(quiz.id)
+            self.entries[quiz.id] = (quiz.content_version, questions, answer_key)
+            self.size += len(questions)
+            while self.size > self.max_questions and len(self.entries) > 1:
+                self._drop(next(iter(self.entries)))
+        return questions, answer_key
+
+    def invalidate(self, quiz_id):
+        with self.lock:
+            self._drop(quiz_id)
+
+    def _drop(self, quiz_id):
+        entry = self.entries.pop(quiz_id, None)
+        if entry:
+            self.size -= len(entry[1])
+
+    def stats(self):
+        with self.lock:
+            return {'quizzes': len(self.entries), 'questions': self.size, 'max_questions': self.max_questions,
+                    'hits': self.hits, 'misses': self.misses}
+
+def question_cache():
+    return current_app.extensions['question_cache']
+
+def questions_changed(quiz_id):
+    # bump the quiz version in the caller's transaction so every worker drops its cached copy
+    Quiz.query.filter_by(id = quiz_id).update({Quiz.content_version: Quiz.content_version + 1}, synchronize_session=False)
+    question_cache().invalidate(quiz_id)
+    catalog_changed()
+
+
+#question banks
+#every question in a chapter is its bank, a quiz with from_bank set draws a fresh paper of chapter.questions_count
+#questions from it for each attempt. the bank's ids are kept per worker while the catalog version is unchanged, so a
+#draw is random.sample over positions plus one primary key lookup for the drawn rows. the drawn ids go into the
+#signed session as a packed token and submit_quiz grades exactly those
+PAPER_MAX_QUESTIONS = 500
+
+class QuestionBanks:
+    def __init__(self, max_questions):
+        self.max_questions = max_questions
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+        # a cold bank is loaded once, not by every request that arrives while it loads
+        self.load_lock = Lock()
+
+    def ids(self, chapter_id, version):
+        # sorted question ids of a chapter's bank at this catalog version
+        with self.lock:
+            entry = self.entries.get(chapter_id)
+            if entry and entry[0] == version:
+                self.entries.move_to_end(chapter_id)
+                self.hits += 1
+                return entry[1]
+        with self.load_lock:
+            with self.lock:
+                entry = self.entries.get(chapter_id)
+                if entry and entry[0] == version:
+                    return entry[1]
+                self.misses += 1
+            deleted = db.select(Quiz.id).where(Quiz.deleted_at.isnot(None))
+            ids = array('q', (row[0] for row in db.session.execute(
+                db.select(Question.id).where(Question.chapter_id == chapter_id, Question.quiz_id.not_in(deleted)).order_by(Question.id))))
+            with self.lock:
+                self._drop(chapter_id)
+                self.entries[chapter_id] = (version, ids)
+                self.size += len(ids)
+                while self.size > self.max_questions and len(self.entries) > 1:
+                    self._drop(next(iter(self.entries)))
+        return ids
+
+    def _drop(self, chapter_id):
+        entry = self.entries.pop(chapter_id, None)
+        if entry:
+            self.size -= len(entry[1])
+
+    def stats(self):
+        with self.lock:
+            return {'chapters': len(self.entries), 'questions': self.size, 'max_questions': self.max_questions,
+                    'hits': self.hits, 'misses': self.misses}
+
+def question_banks():
+    return current_app.extensions['question_banks']
+
+def draw_paper(quiz):
+    # question dicts for one attempt, in id order, the same shape QuestionCache hands start_quiz.html
+    chapter = db.session.get(Chapter, quiz.chapter_id) if quiz.chapter_id else None
+    if chapter is None:
+        return []
+    bank = question_banks().ids(chapter.id, catalog_version()[0])
+    size = min(chapter.questions_count, len(bank), PAPER_MAX_QUESTIONS)
+    return paper_questions([bank[position] for position in random.sample(range(len(bank)), size)])
+
+def paper_questions(question_ids):
+    # question dicts for the given ids in id order, without the answers
+    if not question_ids:
+        return []
+    rows = db.session.query(Question.id, Question.title, Question.question, Question.option1, Question.option2,
+                            Question.option3, Question.option4).filter(Question.id.in_(question_ids)).order_by(Question.id).all()
+    return [row._asdict() for row in rows]
+
+def pack_paper(question_ids):
+    # sorted ids as varint deltas in url-safe base64, about two bytes a question for a 100k bank
+    packed = bytearray()
+    last = 0
+    for question_id in sorted(question_ids):
+        delta = question_id - last
+        last = question_id
+        while delta >= 0x80:
+            packed.append(delta & 0x7f | 0x80)
+            delta >>= 7
+        packed.append(delta)
+    return urlsafe_b64encode(bytes(packed)).decode().rstrip('=')
+
+def unpack_paper(token):
+    question_ids = []
+    last = delta = shift = 0
+    for byte in urlsafe_b64decode(token + '=' * (-len(token) % 4)):
+        delta |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            last += delta
+            question_ids.append(last)
+            delta = shift = 0
+    return question_ids
+
+def paper_answer_key(question_ids):
+    # {question_id: correct} for a drawn paper, questions deleted since the draw are left out
+    if not question_ids:
+        return {}
+    return dict(db.session.query(Question.id, Question.correct).filter(Question.id.in_(question_ids)).all())
+
+
+#grading
+#an answer key is the tuple of correct options ordered by question id, a batch of submissions is
+#lined up against it in the same order and each score is the count of positions that match
+CHOICES = (1, 2, 3, 4)
+
+def parse_choice(value):
+    # option number picked for a question, 0 when unanswered or not a valid option
+    try:
+        choice = int(value)
+    except (TypeError, ValueError):
+        return 0
+    return choice if choice in CHOICES else 0
+
+def dump_answers(answers):
+    return json.dumps({str(question_id): choice for question_id, choice in answers.items() if choice})
+
+def load_answers(answers):
+    return {int(question_id): parse_choice(choice) for question_id, choice in json.loads(answers or "{}").items()}
+
+def grade_batch(answer_key, submissions):
+    # scores for a list of {question_id: choice} submissions against a {question_id: correct} key
+    question_ids = sorted(answer_key)
+    key = tuple(answer_key[question_id] for question_id in question_ids)
+    # unanswered questions line up as None or 0 and never equal a correct option
+    return [sum(map(eq, key, map(answers.get, question_ids))) for answers in submissions]
+
+def regrade_quiz(quiz_id, batch_size=1000):
+    # regrade every stored attempt of a quiz against its current answer key, one transaction per batch
+    quiz = db.session.get(Quiz, quiz_id)
+    if quiz is None:
+        raise click.ClickException(f"No quiz with id {quiz_id}")
+    if not quiz.from_bank:
+        questions, answer_key = question_cache().get(quiz)
+        total = len(answer_key)
+    last_id = 0
+    changed_users = set()
+    while True:
+        batch = db.session.query(Scores.id, Scores.user_id, Scores.score, Scores.total, Scores.answers).filter(
+            Scores.quiz_id == quiz_id, Scores.answers.isnot(None), Scores.id > last_id
+        ).order_by(Scores.id).limit(batch_size).all()
+        if not batch:
+            break
+        if quiz.from_bank:
+            # every attempt had its own paper, the saved answers say which questions were on it, and they're graded
+            # by id since a question can have moved to another chapter's bank after the attempt
+            submissions = [load_answers(row.answers) for row in batch]
+            question_ids = sorted(set().union(*submissions))
+            answer_key = {}
+            for start in range(0, len(question_ids), PAPER_MAX_QUESTIONS):
+                answer_key.update(paper_answer_key(question_ids[start:start + PAPER_MAX_QUESTIONS]))
+            # unanswered questions aren't saved, so the paper size stays whatever was recorded
+            scores = [sum(answer_key.get(question_id) == choice for question_id, choice in answers.items()) for answers in submissions]
+            totals = [row.total for row in batch]
+        else:
+            scores = grade_batch(answer_key, [load_answers(row.answers) for row in batch])
+            totals = [total] * len(batch)
+        changed = [(row, score, row_total) for row, score, row_total in zip(batch, scores, totals) if (row.score, row.total) != (score, row_total)]
+        if changed:
+            db.session.execute(update(Scores), [{'id': row.id, 'score': score, 'total': row_total} for row, score, row_total in changed])
+            changed_users.update(row.user_id for row, score, row_total in changed)
+        db.session.commit()
+        last_id = batch[-1].id
+    if changed_users:
+        rebuild_rollups({'user': changed_users, 'quiz': [quiz_id], 'chapter': [quiz.chapter_id], 'subject': [quiz.subject_id]})
+        rebuild_user_rollups(changed_users)
+        rebuild_leaderboards({'quiz': [quiz_id], 'chapter': [quiz.chapter_id], 'subject': [quiz.subject_id]})
+        db.session.commit()
+    return len(changed_users)
+
+@command("regrade-quiz")
+@click.argument("quiz_id", type=int)
+@click.option("--batch-size", default=1000, help="Scores rows updated per transaction.")
+def regrade_quiz_command(quiz_id, batch_size):
+    """Regrade all stored attempts of a quiz after its answers changed."""
+    users = regrade_quiz(quiz_id, batch_size)
+    print(f"Regraded quiz {quiz_id}, scores changed for {users} users")
+
+
+#bulk import
+#subjects, chapters, quizzes and questions streamed from CSV or JSONL one record at a time, every record
+#has a type and an optional key that later records use to point at it ("#<id>" points at an existing row)
+IMPORT_KINDS = ('subject', 'chapter', 'quiz', 'question')
+IMPORT_BATCH_SIZE = 1000
+IMPORT_COMMIT_EVERY = 5000
+IMPORT_ERRORS_KEPT = 200
+
+def read_records(stream, format):
+    # (line number, record) pairs, a record that can't be parsed comes through as the ValueError
+    if format == 'jsonl':
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text)
+            except ValueError as error:
+                yield line, ValueError(f"bad JSON: {error}")
+    else:
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+
+def import_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.json')) else 'csv'
+
+class BulkImport:
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE, commit_every=IMPORT_COMMIT_EVERY):
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        # key -> (id, parent id) for everything inserted or looked up so far
+        self.keys = {kind: {} for kind in IMPORT_KINDS}
+        self.pending = {kind: [] for kind in IMPORT_KINDS}
+        self.pending_keys = set()
+        self.subject_names = None
+        self.changed_quizzes = set()
+        self.rows = 0
+        self.inserted = {kind: 0 for kind in IMPORT_KINDS}
+        self.errors = []
+        self.error_count = 0
+
+    def run(self, records):
+        started = time.perf_counter()
+        for line, record in records:
+            self.rows += 1
+            try:
+                self.add(record)
+            except ValueError as error:
+                self.error_count += 1
+                if len(self.errors) < IMPORT_ERRORS_KEPT:
+                    self.errors.append(f"line {line}: {error}")
+            if self.rows % self.commit_every == 0:
+                self.flush()
+                db.session.commit()
+        self.flush()
+        for quiz_id in self.changed_quizzes:
+            questions_changed(quiz_id)
+        if any(self.inserted.values()):
+            catalog_changed()
+        db.session.commit()
+        seconds = time.perf_counter() - started
+        return {'rows': self.rows, 'inserted': self.inserted, 'error_count': self.error_count, 'errors': self.errors,
+                'seconds': round(seconds, 3), 'rows_per_second': round(self.rows / seconds) if seconds else self.rows}
+
+    def add(self, record):
+        if isinstance(record, Exception):
+            raise record
+        kind = str(record.get('type') or '').strip()
+        if kind not in IMPORT_KINDS:
+            raise ValueError(f"type must be one of {', '.join(IMPORT_KINDS)}")
+        key = str(record.get('key') or '').strip()
+        if key and (key in self.keys[kind] or (kind, key) in self.pending_keys):
+            raise ValueError(f"{kind} key '{key}' used twice")
+        row = getattr(self, f"{kind}_row")(record)
+        self.pending[kind].append((key, row))
+        if key:
+            self.pending_keys.add((kind, key))
+        if len(self.pending[kind]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # insert everything pending, parents first so their ids are known to children
+        for kind in IMPORT_KINDS:
+            batch = self.pending[kind]
+            if not batch:
+                continue
+            rows = [row for key, row in batch]
+            if kind == 'question':
+                db.session.execute(insert(Question), rows)
+            else:
+                model = IMPORT_MODELS[kind]
+                ids = db.session.execute(insert(model).returning(model.id, sort_by_parameter_order=True), rows).scalars().all()
+                parent = {'subject': None, 'chapter': 'subject_id', 'quiz': 'chapter_id'}[kind]
+                for (key, row), new_id in zip(batch, ids):
+                    if key:
+                        self.keys[kind][key] = (new_id, row[parent] if parent else None)
+            self.inserted[kind] += len(batch)
+            batch.clear()
+        self.pending_keys.clear()
+
+    def resolve(self, kind, ref):
+        # (id, parent id) of the row a record points at
+        ref = str(ref or '').strip()
+        if not ref:
+            raise ValueError(f"{kind} is required")
+        if (kind, ref) in self.pending_keys:
+            self.flush()
+        if ref in self.keys[kind]:
+            return self.keys[kind][ref]
+        if ref.startswith('#') and ref[1:].isdigit():
+            model = IMPORT_MODELS[kind]
+            parent = {'subject': model.id, 'chapter': Chapter.subject_id, 'quiz': Quiz.chapter_id}[kind]
+            found = db.session.query(model.id, parent).filter(model.id == int(ref[1:])).first()
+            if found:
+                self.keys[kind][ref] = (found[0], found[1])
+                return self.keys[kind][ref]
+        raise ValueError(f"unknown {kind} '{ref}'")
+
+    def subject_row(self, record):
+        name = required(record, 'name')
+        if self.subject_names is None:
+            self.subject_names = {row[0] for row in db.session.query(Subject.name)}
+        if name in self.subject_names:
+            raise ValueError(f"subject '{name}' already exists")
+        self.subject_names.add(name)
+        return dict(name = name, description = record.get('description') or None)
+
+    def chapter_row(self, record):
+        return dict(name = required(record, 'name'), description = record.get('description') or None,
+                    questions_count = number(record, 'questions_count', default = 0),
+                    subject_id = self.resolve('subject', record.get('subject'))[0])
+
+    def quiz_row(self, record):
+        chapter_id, subject_id = self.resolve('chapter', record.get('chapter'))
+        return dict(quiz_name = required(record, 'quiz_name'), duration = number(record, 'duration'), score = 0,
+                    chapter_id = chapter_id, subject_id = subject_id,
+                    from_bank = str(record.get('from_bank') or '').strip().lower() in ('1', 'true', 'yes'))
+
+    def question_row(self, record):
+        row = {field: required(record, field) for field in ('title', 'question', 'option1', 'option2', 'option3', 'option4')}
+        row['correct'] = parse_choice(record.get('correct'))
+        if not row['correct']:
+            raise ValueError(f"correct must be one of {CHOICES}")
+        row['quiz_id'], row['chapter_id'] = self.resolve('quiz', record.get('quiz'))
+        self.changed_quizzes.add(row['quiz_id'])
+        return row
+
+IMPORT_MODELS = {'subject': Subject, 'chapter': Chapter, 'quiz': Quiz, 'question': Question}
+
+def required(record, field):
+    value = str(record.get(field) or '').strip()
+    if not value:
+        raise ValueError(f"{field} is required")
+    return value
+
+def number(record, field, default=None):
+    value = str(record.get(field) or '').strip()
+    if not value and default is not None:
+        return default
+    if not value.isdigit():
+        raise ValueError(f"{field} must be a whole number")
+    return int(value)
+
+@command("import-catalog")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--batch-size", default=IMPORT_BATCH_SIZE, help="Rows per INSERT batch.")
+def import_catalog_command(path, batch_size):
+    """Import subjects, chapters, quizzes and questions from a CSV or JSONL file."""
+    with open(path, newline='', encoding='utf-8') as stream:
+        report = BulkImport(batch_size=batch_size).run(read_records(stream, import_format(path)))
+    for error in report['errors']:
+        print(error)
+    print(f"{report['rows']} rows in {report['seconds']}s ({report['rows_per_second']} rows/s), "
+          f"inserted {report['inserted']}, {report['error_count']} errors")
+
+
+#scores export
+#Scores joined with their user, quiz, chapter and subject, streamed in batches so memory stays flat
+EXPORT_BATCH_SIZE = 1000
+
+def export_select(since=None, until=None, subject_id=None, chapter_id=None, quiz_id=None):
+    select = db.select(
+        Scores.id.label('score_id'), Scores.created_at, Scores.user_id, User.username, User.name,
+        Scores.quiz_id, Quiz.quiz_name, Scores.chapter_id, Chapter.name.label('chapter_name'),
+        Scores.subject_id, Subject.name.label('subject_name'), Scores.score, Scores.total,
+    ).join(User, User.id == Scores.user_id).join(Quiz, Quiz.id == Scores.quiz_id).outerjoin(
+        Chapter, Chapter.id == Scores.chapter_id).outerjoin(Subject, Subject.id == Scores.subject_id).where(Quiz.deleted_at.is_(None)).order_by(Scores.id)
+    if since:
+        select = select.where(Scores.created_at >= since)
+    if until:
+        # until is a day, everything on that day is included
+        select = select.where(Scores.created_at < until + timedelta(days=1))
+    if subject_id:
+        select = select.where(Scores.subject_id == subject_id)
+    if chapter_id:
+        select = select.where(Scores.chapter_id == chapter_id)
+    if quiz_id:
+        select = select.where(Scores.quiz_id == quiz_id)
+    return select
+
+def export_chunks(select, format='csv'):
+    # text chunks of CSV or JSONL, one per batch of rows
+    result = db.session.execute(select.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    columns = list(result.keys())
+    if format == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(columns)
+        yield buffer.getvalue()
+    for rows in result.partitions():
+        buffer = io.StringIO()
+        if format == 'csv':
+            csv.writer(buffer).writerows(rows)
+        else:
+            for row in rows:
+                buffer.write(json.dumps(dict(zip(columns, row)), default=str) + "\n")
+        yield buffer.getvalue()
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def parse_day(value):
+    return datetime.strptime(value, '%Y-%m-%d') if value else None
+
+@command("export-scores")
+@click.option("--output", "-o", type=click.Path(dir_okay=False), required=True)
+@click.option("--format", "format", type=click.Choice(['csv', 'jsonl']), default='csv')
+@click.option("--gzip", "compress", is_flag=True, help="gzip the output.")
+@click.option("--since", help="First day to include, YYYY-MM-DD.")
+@click.option("--until", help="Last day to include, YYYY-MM-DD.")
+@click.option("--subject-id", type=int)
+@click.option("--chapter-id", type=int)
+@click.option("--quiz-id", type=int)
+def export_scores_command(output, format, compress, since, until, subject_id, chapter_id, quiz_id):
+    """Stream the Scores history joined with users, quizzes, chapters and subjects to a file."""
+    chunks = export_chunks(export_select(parse_day(since), parse_day(until), subject_id, chapter_id, quiz_id), format)
+    with open(output, 'wb') as out:
+        for chunk in (gzip_chunks(chunks) if compress else (chunk.encode('utf-8') for chunk in chunks)):
+            out.write(chunk)
+    print(f"Wrote {output}")
+
+
+#analytics
+#chart data for the summary pages, cached per worker (up to ANALYTICS_CACHE_SIZE entries) for ANALYTICS_CACHE_TTL seconds and dropped
+#straight away here when a quiz changes or the user submits, other workers catch up within the TTL
+class AnalyticsCache:
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key, compute):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(key)
+                return entry[1]
+            self.entries.pop(key, None)
+        value = compute()
+        with self.lock:
+            self.entries[key] = (now + self.ttl, value)
+            self.entries.move_to_end(key)
+            # least recently used first, so one entry per learner can't grow without bound
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+def analytics_cache():
+    return current_app.extensions['analytics_cache']
+
+def catalog_changed():
+    # bump the catalog version in the caller's transaction, the commit makes every worker's cached pages stale
+    CatalogState.query.filter_by(id = 1).update(
+        {CatalogState.version: CatalogState.version + 1, CatalogState.updated_at: datetime.utcnow()}, synchronize_session=False)
+    g.pop('catalog_version', None)
+    analytics_cache().invalidate('catalog')
+
+def catalog_version():
+    # (version, last change) of the catalog, read once per request
+    if 'catalog_version' not in g:
+        state = db.session.execute(db.select(CatalogState.version, CatalogState.updated_at).where(CatalogState.id == 1)).first()
+        g.catalog_version = tuple(state) if state else (0, None)
+    return g.catalog_version
+
+def catalog_stats():
+    # quizzes per chapter and in total, the same for every user
+    chapter_quiz_count = db.session.query(Chapter.name, db.func.count(Quiz.id)).join(Quiz).filter(Quiz.deleted_at.is_(None)).group_by(Chapter.id).all()
+    return {
+        'labels': [chapter[0] for chapter in chapter_quiz_count],
+        'quiz_counts': [chapter[1] for chapter in chapter_quiz_count],
+        'total_quizzes_count': db.session.query(db.func.count(Quiz.id)).filter(Quiz.deleted_at.is_(None)).scalar(),
+    }
+
+def user_stats(user_id):
+    # average score by subject and chapter and attempts per day, from the user's rollups
+    rollups = UserRollup.query.filter_by(user_id=user_id).all()
+    ids = {scope: [int(r.scope_key) for r in rollups if r.scope == scope] for scope in ('subject', 'chapter')}
+    names = {
+        'subject': dict(db.session.query(Subject.id, Subject.name).filter(Subject.id.in_(ids['subject']))) if ids['subject'] else {},
+        'chapter': dict(db.session.query(Chapter.id, Chapter.name).filter(Chapter.id.in_(ids['chapter']))) if ids['chapter'] else {},
+    }
+
+    def averages(scope):
+        return [{'name': names[scope].get(int(r.scope_key), f"#{r.scope_key}"), 'attempts': r.attempts,
+                 'average': round(100 * r.score_sum / r.total_sum, 1) if r.total_sum else 0}
+                for r in rollups if r.scope == scope]
+
+    return {
+        'attempted_quizzes_count': db.session.query(db.func.count()).select_from(attempted_quiz_ids(user_id).subquery()).scalar(),
+        'by_subject': averages('subject'),
+        'by_chapter': averages('chapter'),
+        'by_day': sorted(({'day': r.scope_key, 'attempts': r.attempts} for r in rollups if r.scope == 'day'), key=lambda day: day['day']),
+    }
+
+def admin_stats():
+    rows = db.session.query(User.username, db.func.coalesce(AttemptRollup.attempts, 0)).outerjoin(
+        AttemptRollup, (AttemptRollup.scope == 'user') & (AttemptRollup.scope_id == User.id)
+    ).filter(User.is_admin == 0).all()
+    return {'username': [row[0] for row in rows], 'quiz_attempts': [row[1] for row in rows]}
+
+def chart_response(payload):
+    # revalidated on every load so a submit shows up straight away, unchanged data comes back as a 304
+    response = jsonify(payload)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+#attempt rollups
+#counters are bumped in the database with INSERT ... ON CONFLICT DO UPDATE, so workers writing at the same time
+#(several writer threads against a server database) add to each other's totals instead of overwriting them
+def upsert(model):
+    # SQLite and PostgreSQL spell ON CONFLICT the same way
+    return (postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite).insert(model)
+
+def greater(column, value):
+    # GREATEST() on PostgreSQL is max() on SQLite, a CASE works on both
+    return db.case((value > column, value), else_=column)
+
+def record_attempts(scores):
+    # add new Scores rows to their rollups with one upsert per table for the whole batch, caller commits both together
+    totals = defaultdict(lambda: [0, 0, 0])
+    user_totals = defaultdict(lambda: [0, 0, 0])
+    for score in scores:
+        score.created_at = score.created_at or datetime.utcnow()
+        for scope, column in ROLLUP_SCOPES.items():
+            scope_id = getattr(score, column.key)
+            if scope_id is None:
+                continue
+            total = totals[(scope, scope_id)]
+            total[0] += 1
+            total[1] += score.score
+            total[2] = max(total[2], score.score)
+        keys = {'subject': score.subject_id, 'chapter': score.chapter_id, 'day': score.created_at.date().isoformat()}
+        for scope, key in keys.items():
+            if key is None:
+                continue
+            total = user_totals[(score.user_id, scope, str(key))]
+            total[0] += 1
+            total[1] += score.score
+            total[2] += score.total
+
+    if totals:
+        statement = upsert(AttemptRollup)
+        db.session.execute(statement.on_conflict_do_update(index_elements=['scope', 'scope_id'], set_={
+            'attempts': AttemptRollup.attempts + statement.excluded.attempts,
+            'score_sum': AttemptRollup.score_sum + statement.excluded.score_sum,
+            'best_score': greater(AttemptRollup.best_score, statement.excluded.best_score),
+        }), [dict(scope=scope, scope_id=scope_id, attempts=attempts, score_sum=score_sum, best_score=best_score)
+             for (scope, scope_id), (attempts, score_sum, best_score) in totals.items()])
+    if user_totals:
+        statement = upsert(UserRollup)
+        db.session.execute(statement.on_conflict_do_update(index_elements=['user_id', 'scope', 'scope_key'], set_={
+            'attempts': UserRollup.attempts + statement.excluded.attempts,
+            'score_sum': UserRollup.score_sum + statement.excluded.score_sum,
+            'total_sum': UserRollup.total_sum + statement.excluded.total_sum,
+        }), [dict(user_id=user_id, scope=scope, scope_key=scope_key, attempts=attempts, score_sum=score_sum, total_sum=total_sum)
+             for (user_id, scope, scope_key), (attempts, score_sum, total_sum) in user_totals.items()])
+
+def rebuild_rollups(scope_ids=None):
+    # recompute rollups from Scores, scope_ids = {scope: [ids]} limits it to those rows
+    for scope, column in ROLLUP_SCOPES.items():
+        ids = None if scope_ids is None else [i for i in scope_ids.get(scope, []) if i is not None]
+        if ids is not None and not ids:
+            continue
+        stale = AttemptRollup.query.filter_by(scope=scope)
+        totals = db.select(literal(scope), column, db.func.count(Scores.id), db.func.sum(Scores.score), db.func.max(Scores.score)).where(column.isnot(None)).group_by(column)
+        if ids is not None:
+            stale = stale.filter(AttemptRollup.scope_id.in_(ids))
+            totals = totals.where(column.in_(ids))
+        stale.delete(synchronize_session=False)
+        db.session.execute(insert(AttemptRollup).from_select(['scope', 'scope_id', 'attempts', 'score_sum', 'best_score'], totals))
+
+def rebuild_user_rollups(user_ids=None):
+    # recompute the per-user rollups from Scores, for the given users or everyone
+    user_ids = None if user_ids is None else [i for i in user_ids if i is not None]
+    if user_ids is not None and not user_ids:
+        return
+    keys = {
+        'subject': db.cast(Scores.subject_id, db.String),
+        'chapter': db.cast(Scores.chapter_id, db.String),
+        'day': db.cast(db.func.date(Scores.created_at), db.String),
+    }
+    stale = UserRollup.query
+    if user_ids is not None:
+        stale = stale.filter(UserRollup.user_id.in_(user_ids))
+    stale.delete(synchronize_session=False)
+    for scope, key in keys.items():
+        totals = db.select(Scores.user_id, literal(scope), key, db.func.count(Scores.id), db.func.sum(Scores.score), db.func.sum(Scores.total)).where(
+            key.isnot(None)).group_by(Scores.user_id, key)
+        if user_ids is not None:
+            totals = totals.where(Scores.user_id.in_(user_ids))
+        db.session.execute(insert(UserRollup).from_select(['user_id', 'scope', 'scope_key', 'attempts', 'score_sum', 'total_sum'], totals))
+
+@command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Recompute the attempt rollups from the Scores table."""
+    rebuild_rollups()
+    rebuild_user_rollups()
+    db.session.commit()
+    print(f"Rebuilt {AttemptRollup.query.count()} rollup rows")
+
+#leaderboards
+#boards are kept current on every submit, top N reads the rank index and a rank sums the
+#points histogram, so neither depends on how many Scores rows there are
+LEADERBOARD_SCOPES = ('quiz', 'chapter', 'subject')
+LEADERBOARD_SIZE = 10
+LEADERBOARD_MAX = 100
+
+def record_leaderboards(scores):
+    # only a new best on a quiz moves a user, the gain carries up to its chapter and subject,
+    # entries are read once for the whole batch and written back as upserts, caller commits
+    best = {}
+    for score in scores:
+        key = (score.user_id, score.quiz_id)
+        if key not in best or score.score > best[key].score:
+            best[key] = score
+    if not best:
+        return
+    boards = {
+        'quiz': {score.quiz_id for score in best.values()},
+        'chapter': {score.chapter_id for score in best.values() if score.chapter_id is not None},
+        'subject': {score.subject_id for score in best.values() if score.subject_id is not None},
+    }
+
+    # the entries read here are locked until commit on a server database, SQLite's write lock already covers them
+    points = {(row.scope, row.scope_id, row.user_id): row.points for row in db.session.query(
+        LeaderboardEntry.scope, LeaderboardEntry.scope_id, LeaderboardEntry.user_id, LeaderboardEntry.points).filter(
+        LeaderboardEntry.user_id.in_({key[0] for key in best}),
+        or_(*[(LeaderboardEntry.scope == scope) & LeaderboardEntry.scope_id.in_(ids) for scope, ids in boards.items() if ids]),
+    ).with_for_update()}
+    # quiz boards keep the best score, chapter and subject boards add what the quiz best went up by
+    quiz_entries = {}
+    gains = {}
+    bucket_changes = defaultdict(int)
+
+    def move(key, new_points):
+        if key in points:
+            bucket_changes[(key[0], key[1], points[key])] -= 1
+        points[key] = new_points
+        bucket_changes[(key[0], key[1], new_points)] += 1
+
+    for (user_id, quiz_id), score in best.items():
+        previous = points.get(('quiz', quiz_id, user_id))
+        if previous is not None and score.score <= previous:
+            continue
+        reached_at = score.created_at or datetime.utcnow()
+        move(('quiz', quiz_id, user_id), score.score)
+        quiz_entries[('quiz', quiz_id, user_id)] = (score.score, reached_at)
+        for scope, scope_id in (('chapter', score.chapter_id), ('subject', score.subject_id)):
+            if scope_id is None:
+                continue
+            key = (scope, scope_id, user_id)
+            move(key, points.get(key, 0) + score.score - (previous or 0))
+            gain = gains.get(key, (0, reached_at))[0] + score.score - (previous or 0)
+            gains[key] = (gain, reached_at)
+
+    if quiz_entries:
+        statement = upsert(LeaderboardEntry)
+        db.session.execute(statement.on_conflict_do_update(index_elements=['scope', 'scope_id', 'user_id'], set_={
+            'points': greater(LeaderboardEntry.points, statement.excluded.points),
+            'reached_at': db.case((statement.excluded.points > LeaderboardEntry.points, statement.excluded.reached_at), else_=LeaderboardEntry.reached_at),
+        }), [dict(scope=scope, scope_id=scope_id, user_id=user_id, points=new_points, reached_at=reached_at)
+             for (scope, scope_id, user_id), (new_points, reached_at) in quiz_entries.items()])
+    if gains:
+        statement = upsert(LeaderboardEntry)
+        db.session.execute(statement.on_conflict_do_update(index_elements=['scope', 'scope_id', 'user_id'], set_={
+            'points': LeaderboardEntry.points + statement.excluded.points,
+            'reached_at': statement.excluded.reached_at,
+        }), [dict(scope=scope, scope_id=scope_id, user_id=user_id, points=gain, reached_at=reached_at)
+             for (scope, scope_id, user_id), (gain, reached_at) in gains.items()])
+
+    bucket_changes = {key: change for key, change in bucket_changes.items() if change}
+    if bucket_changes:
+        statement = upsert(LeaderboardBucket)
+        db.session.execute(statement.on_conflict_do_update(index_elements=['scope', 'scope_id', 'points'], set_={
+            'users': LeaderboardBucket.users + statement.excluded.users,
+        }), [dict(scope=scope, scope_id=scope_id, points=bucket_points, users=change)
+             for (scope, scope_id, bucket_points), change in bucket_changes.items()])
+
+def rebuild_leaderboards(scope_ids=None):
+    # recompute boards from Scores, scope_ids = {scope: [ids]} limits it to those boards
+    best = db.select(
+        Scores.user_id, Scores.quiz_id, Scores.chapter_id, Scores.subject_id,
+        db.func.max(Scores.score).label('points'), db.func.max(Scores.created_at).label('reached_at'),
+    ).group_by(Scores.user_id, Scores.quiz_id, Scores.chapter_id, Scores.subject_id).subquery()
+    for scope in LEADERBOARD_SCOPES:
+        ids = None if scope_ids is None else [i for i in scope_ids.get(scope, []) if i is not None]
+        if ids is not None and not ids:
+            continue
+        column = best.c[f"{scope}_id"]
+        boards = db.select(
+            literal(scope), column, best.c.user_id, db.func.sum(best.c.points),
+            db.func.coalesce(db.func.max(best.c.reached_at), datetime.utcnow()),
+        ).where(column.isnot(None)).group_by(column, best.c.user_id)
+        stale = [LeaderboardEntry.query.filter_by(scope=scope), LeaderboardBucket.query.filter_by(scope=scope)]
+        if ids is not None:
+            boards = boards.where(column.in_(ids))
+            stale = [stale[0].filter(LeaderboardEntry.scope_id.in_(ids)), stale[1].filter(LeaderboardBucket.scope_id.in_(ids))]
+        for query in stale:
+            query.delete(synchronize_session=False)
+        db.session.execute(insert(LeaderboardEntry).from_select(['scope', 'scope_id', 'user_id', 'points', 'reached_at'], boards))
+        buckets = db.select(literal(scope), LeaderboardEntry.scope_id, LeaderboardEntry.points, db.func.count()).where(
+            LeaderboardEntry.scope == scope).group_by(LeaderboardEntry.scope_id, LeaderboardEntry.points)
+        if ids is not None:
+            buckets = buckets.where(LeaderboardEntry.scope_id.in_(ids))
+        db.session.execute(insert(LeaderboardBucket).from_select(['scope', 'scope_id', 'points', 'users'], buckets))
+
+def leaderboard_top(scope, scope_id, limit=LEADERBOARD_SIZE):
+    rows = db.session.query(LeaderboardEntry.points, User.id, User.username).join(User, User.id == LeaderboardEntry.user_id).filter(
+        LeaderboardEntry.scope == scope, LeaderboardEntry.scope_id == scope_id
+    ).order_by(LeaderboardEntry.points.desc(), LeaderboardEntry.reached_at).limit(limit).all()
+    # users with equal points share a rank
+    top, rank = [], 0
+    for position, (points, user_id, username) in enumerate(rows, 1):
+        if not top or points != top[-1]['points']:
+            rank = position
+        top.append({'rank': rank, 'user_id': user_id, 'username': username, 'points': points})
+    return top
+
+def leaderboard_rank(scope, scope_id, user_id):
+    entry = LeaderboardEntry.query.filter_by(scope=scope, scope_id=scope_id, user_id=user_id).first()
+    if not entry:
+        return None
+    above, players = db.session.query(
+        db.func.sum(db.case((LeaderboardBucket.points > entry.points, LeaderboardBucket.users), else_=0)),
+        db.func.sum(LeaderboardBucket.users),
+    ).filter(LeaderboardBucket.scope == scope, LeaderboardBucket.scope_id == scope_id).one()
+    return {'rank': (above or 0) + 1, 'points': entry.points, 'players': players or 0}
+
+@route("/leaderboard/<scope>/<int:scope_id>")
+@query_budget(3)
+def leaderboard(scope, scope_id):
+    if scope not in LEADERBOARD_SCOPES:
+        return jsonify(error = "no such leaderboard"), 404
+    limit = max(1, min(request.args.get('limit', LEADERBOARD_SIZE, type=int), LEADERBOARD_MAX))
+    me = leaderboard_rank(scope, scope_id, session['user_id']) if session.get('user_id') else None
+    return jsonify(top = leaderboard_top(scope, scope_id, limit), me = me)
+
+@command("rebuild-leaderboards")
+def rebuild_leaderboards_command():
+    """Recompute every leaderboard from the Scores table."""
+    rebuild_leaderboards()
     db.session.commit()
+    print(f"Rebuilt {LeaderboardEntry.query.count()} leaderboard entries")
+
+#submission queue
+#submit_quiz grades straight away and hands the Scores row to one writer thread per worker, which commits
+#whatever has queued up in a single transaction, so an exam ending costs a few commits instead of one per student
+class SubmissionQueueFull(Exception):
+    pass
+
+class SubmissionQueue:
+    def __init__(self, size, batch, interval, timeout):
+        self.size = size
+        self.batch = batch
+        self.interval = interval
+        self.timeout = timeout
+        self.lock = Lock()
+        self.pid = None
+        self.queue = None
+        self.thread = None
+        self.flushes = 0
+        self.rows = 0
+        self.rejected = 0
+        self.failed = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def start(self, app):
+        # a forked worker gets its own queue and writer
+        self.app = app
+        self.queue = queue.Queue(self.size)
+        self.thread = Thread(target=self.run, name='submissions', daemon=True)
+        self.thread.start()
+        self.pid = os.getpid()
+        atexit.register(self.close)
+
+    def put(self, row):
+        with self.lock:
+            if self.pid != os.getpid():
+                self.start(current_app._get_current_object())
+        try:
+            # a full queue holds the request for up to timeout seconds before turning it away
+            self.queue.put(row, timeout=self.timeout)
+        except queue.Full:
+            self.rejected += 1
+            raise SubmissionQueueFull()
+
+    def run(self):
+        running = True
+        while running:
+            rows = [self.queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(rows) < self.batch and rows[-1] is not None:
+                try:
+                    rows.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if rows[-1] is None:
+                running = False
+            pending = [row for row in rows if row is not None]
+            if pending:
+                self.write(pending)
+            for _ in rows:
+                self.queue.task_done()
+
+    def write(self, rows):
+        started = time.perf_counter()
+        with self.app.app_context():
+            try:
+                save_submissions(rows)
+            except Exception:
+                # one bad row should not cost the rest of the batch, retry them one at a time
+                db.session.rollback()
+                current_app.logger.exception("Batch of %d submissions failed, retrying one by one", len(rows))
+                for row in rows:
+                    try:
+                        save_submissions([row])
+                    except Exception:
+                        db.session.rollback()
+                        self.failed += 1
+                        current_app.logger.exception("Dropped submission %r", row)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.rows += len(rows)
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+
+    def flush(self):
+        # wait until everything queued so far is committed
+        if self.pid == os.getpid():
+            self.queue.join()
+
+    def close(self):
+        # shutdown drains the queue before the process exits
+        if self.pid == os.getpid() and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def stats(self):
+        return {
+            'depth': self.queue.qsize() if self.pid == os.getpid() else 0,
+            'capacity': self.size,
+            'flushes': self.flushes,
+            'rows': self.rows,
+            'rows_per_flush': round(self.rows / self.flushes, 1) if self.flushes else 0,
+            'last_flush_ms': round(self.last_flush_ms, 2),
+            'max_flush_ms': round(self.max_flush_ms, 2),
+            'rejected': self.rejected,
+            'failed': self.failed,
+        }
+
+def submission_queue():
+    return current_app.extensions['submission_queue']
+
+def save_submissions(rows):
+    # Scores rows and everything kept alongside them, committed together
+    scores = []
+    for row in rows:
+        score = Scores(**{key: value for key, value in row.items() if key != 'created_at'})
+        score.created_at = row['created_at']
+        scores.append(score)
+    db.session.add_all(scores)
+    # inserting first takes SQLite's write lock, so the leaderboard entries read below can't change under us
+    db.session.flush()
+    record_attempts(scores)
+    record_leaderboards(scores)
+    db.session.commit()
+    for user_id in {score.user_id for score in scores}:
+        analytics_cache().invalidate(('user', user_id))
+
+def queue_submission(row):
+    # SUBMIT_QUEUE_SIZE = 0 writes in the request instead
+    if current_app.config['SUBMIT_QUEUE_SIZE'] <= 0:
+        save_submissions([row])
+    else:
+        submission_queue().put(row)
+
+@route("/admin/submissions/stats")
+def submission_stats():
+    if not session.get('is_admin'):
+        return jsonify(error = "admin only"), 403
+    return jsonify(submission_queue().stats())
+
+#deletion
+#catalog rows are removed with set-based DELETEs, children first, so nothing is left pointing at a removed parent.
+#when a subtree holds more than PURGE_INLINE_LIMIT questions and scores its quizzes are soft-deleted instead:
+#hidden straight away and purged PURGE_CHUNK rows at a time by a background thread that commits between
+#chunks, so no single transaction holds the write lock for long
+purge_thread = None
+purge_pid = None
+
+def subtree_quiz_ids(kind, ids):
+    if kind == 'quiz':
+        return db.select(Quiz.id).where(Quiz.id.in_(ids))
+    if kind == 'chapter':
+        return db.select(Quiz.id).where(Quiz.chapter_id.in_(ids))
+    chapters = db.select(Chapter.id).where(Chapter.subject_id.in_(ids))
+    return db.select(Quiz.id).where(or_(Quiz.subject_id.in_(ids), Quiz.chapter_id.in_(chapters)))
+
+def delete_catalog(kind, ids):
+    # delete the rows and everything under them in the caller's transaction, True when start_purge() is due after the commit
+    ids = list(ids)
+    quiz_ids = [row[0] for row in db.session.execute(subtree_quiz_ids(kind, ids))]
+    chapter_ids, subject_ids = [], []
+    if kind == 'subject':
+        subject_ids = ids
+        chapter_ids = [row[0] for row in db.session.query(Chapter.id).filter(Chapter.subject_id.in_(ids))]
+    elif kind == 'chapter':
+        chapter_ids = ids
+
+    rows = 0
+    if quiz_ids:
+        rows = db.session.query(db.func.count(Question.id)).filter(Question.quiz_id.in_(quiz_ids)).scalar() + \
+            db.session.query(db.func.count(Scores.id)).filter(Scores.quiz_id.in_(quiz_ids)).scalar()
+    deferred = rows > current_app.config['PURGE_INLINE_LIMIT']
+    if deferred:
+        Quiz.query.filter(Quiz.id.in_(quiz_ids)).update({Quiz.deleted_at: datetime.utcnow()}, synchronize_session=False)
+    elif quiz_ids:
+        purge_quizzes(quiz_ids)
+
+    # foreign keys are enforced, so whatever still names a removed chapter or subject (soft-deleted rows waiting
+    # for the purge included) lets go of it first, and the boards of the removed scopes go with them
+    if chapter_ids:
+        Scores.query.filter(Scores.chapter_id.in_(chapter_ids)).update({Scores.chapter_id: None}, synchronize_session=False)
+        Question.query.filter(Question.chapter_id.in_(chapter_ids)).update({Question.chapter_id: None}, synchronize_session=False)
+        Quiz.query.filter(Quiz.chapter_id.in_(chapter_ids), Quiz.deleted_at.isnot(None)).update({Quiz.chapter_id: None}, synchronize_session=False)
+        Chapter.query.filter(Chapter.id.in_(chapter_ids)).delete(synchronize_session=False)
+    if subject_ids:
+        Scores.query.filter(Scores.subject_id.in_(subject_ids)).update({Scores.subject_id: None}, synchronize_session=False)
+        Quiz.query.filter(Quiz.subject_id.in_(subject_ids), Quiz.deleted_at.isnot(None)).update({Quiz.subject_id: None}, synchronize_session=False)
+        Subject.query.filter(Subject.id.in_(subject_ids)).delete(synchronize_session=False)
+    if chapter_ids or subject_ids:
+        rebuild_rollups({'chapter': chapter_ids, 'subject': subject_ids})
+        rebuild_leaderboards({'chapter': chapter_ids, 'subject': subject_ids})
+
+    for quiz_id in quiz_ids:
+        question_cache().invalidate(quiz_id)
+    catalog_changed()
+    return deferred
+
+def purge_quizzes(quiz_ids, chunk=None):
+    # remove quizzes, their questions and scores and fix the rollups and boards they fed, committing every chunk rows if given
+    quiz_ids = list(quiz_ids)
+    chapters, subjects = set(), set()
+    while True:
+        batch = db.session.query(Scores.id, Scores.user_id, Scores.chapter_id, Scores.subject_id).filter(Scores.quiz_id.in_(quiz_ids)).limit(chunk).all()
+        if not batch:
+            break
+        users = {row.user_id for row in batch}
+        chapters.update(row.chapter_id for row in batch)
+        subjects.update(row.subject_id for row in batch)
+        Scores.query.filter(Scores.id.in_([row.id for row in batch])).delete(synchronize_session=False)
+        rebuild_rollups({'user': users})
+        rebuild_user_rollups(users)
+        if chunk is None:
+            break
+        db.session.commit()
+    while True:
+        batch = [row[0] for row in db.session.query(Question.id).filter(Question.quiz_id.in_(quiz_ids)).limit(chunk)]
+        if not batch:
+            break
+        Question.query.filter(Question.id.in_(batch)).delete(synchronize_session=False)
+        if chunk is None:
+            break
+        db.session.commit()
+    for quiz_id, chapter_id, subject_id in db.session.query(Quiz.id, Quiz.chapter_id, Quiz.subject_id).filter(Quiz.id.in_(quiz_ids)):
+        chapters.add(chapter_id)
+        subjects.add(subject_id)
+    rebuild_rollups({'quiz': quiz_ids, 'chapter': chapters, 'subject': subjects})
+    rebuild_leaderboards({'quiz': quiz_ids, 'chapter': chapters, 'subject': subjects})
+    Quiz.query.filter(Quiz.id.in_(quiz_ids)).delete(synchronize_session=False)
+    if chunk is not None:
+        db.session.commit()
 
-@app.route("/")
+def purge_deleted(app):
+    # purge every soft-deleted quiz, one quiz at a time
+    with app.app_context():
+        while True:
+            quiz_id = db.session.query(Quiz.id).filter(Quiz.deleted_at.isnot(None)).order_by(Quiz.deleted_at).limit(1).scalar()
+            if quiz_id is None:
+                return
+            try:
+                purge_quizzes([quiz_id], current_app.config['PURGE_CHUNK'])
+            except Exception:
+                # what was committed stays purged, the rest is picked up by the next purge
+                db.session.rollback()
+                current_app.logger.exception("Purge of quiz %s stopped", quiz_id)
+                return
+            current_app.extensions['analytics_cache'].invalidate()
+            current_app.logger.info("Purged quiz %s", quiz_id)
+
+def start_purge():
+    # one purge thread per worker, a forked worker starts its own
+    global purge_thread, purge_pid
+    if purge_pid == os.getpid() and purge_thread.is_alive():
+        return
+    purge_thread = Thread(target=purge_deleted, args=(current_app._get_current_object(),), name='purge', daemon=True)
+    purge_thread.start()
+    purge_pid = os.getpid()
+
+@command("purge-deleted")
+def purge_deleted_command():
+    """Purge soft-deleted quizzes now, e.g. after a restart cut a background purge short."""
+    pending = db.session.query(db.func.count(Quiz.id)).filter(Quiz.deleted_at.isnot(None)).scalar()
+    purge_deleted(current_app._get_current_object())
+    print(f"Purged {pending} quizzes")
+
+#page caching
+#rendered catalog fragments are kept per worker and reused while the catalog version is unchanged,
+#GET pages with a cheap validator answer a matching If-None-Match / If-Modified-Since with a 304
+#before the view runs
+class FragmentCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key, version, render):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == version:
+                self.entries.move_to_end(key)
+                return entry[1]
+        html = Markup(render())
+        with self.lock:
+            self.entries[key] = (version, html)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return html
+
+def cached_fragment(key, render):
+    return current_app.extensions['fragment_cache'].get(key, catalog_version()[0], render)
+
+def not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified and request.if_modified_since:
+        return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= request.if_modified_since
+    return False
+
+def conditional(validator):
+    # validator(**view_args) gives (etag, last modified) without doing the view's work
+    def decorator(view):
+        @wraps(view)
+        def conditional_view(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+            etag, last_modified = validator(*args, **kwargs)
+            if not_modified(etag, last_modified):
+                response = current_app.response_class(status = 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+            # the browser keeps the page but asks every time, and shared caches never see it
+            response.cache_control.no_cache = True
+            response.cache_control.private = True
+            return response
+        return conditional_view
+    return decorator
+
+def template_validator(name):
+    # pages that are only their template change when the file does
+    def validator(*args, **kwargs):
+        modified = os.stat(os.path.join(current_app.root_path, current_app.template_folder, name)).st_mtime
+        return f"{zlib.crc32(name.encode()):x}-{int(modified * 1000):x}", datetime.fromtimestamp(modified, timezone.utc).replace(tzinfo=None)
+    return validator
+
+def catalog_validator(page):
+    # catalog pages change with the catalog version, one per page of the listing
+    def validator(*args, **kwargs):
+        version, updated_at = catalog_version()
+        return f"{page}-{version}-{request.args.get('cursor', '')}", updated_at
+    return validator
+
+@route("/")
+@conditional(template_validator("home.html"))
 def home():
     return render_template("home.html")
 
+#full text search
+#one FTS5 table over subjects, chapters, quizzes, questions and users kept in sync by triggers,
+#rowid is id * 8 + kind so a row is found again without scanning
+SEARCH_KINDS = {
+    'subject': (1, "subject", "new.name", "coalesce(new.description, '')"),
+    'chapter': (2, "chapter", "new.name", "coalesce(new.description, '')"),
+    'quiz': (3, "quiz", "coalesce(new.quiz_name, '')", "''"),
+    'question': (4, "question", "new.title", "new.question || ' ' || new.option1 || ' ' || new.option2 || ' ' || new.option3 || ' ' || new.option4"),
+    'user': (5, '"user"', "new.username", "new.name || ' ' || coalesce(new.qualification, '')"),
+}
+SEARCH_PER_PAGE = 20
+
+def search_index_ddl():
+    statements = ["CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(kind UNINDEXED, ref_id UNINDEXED, title, body, prefix='2 3')"]
+    for kind, (code, table, title, body) in SEARCH_KINDS.items():
+        add = f"INSERT INTO search_index(rowid, kind, ref_id, title, body) VALUES (new.id * 8 + {code}, '{kind}', new.id, {title}, {body});"
+        remove = f"DELETE FROM search_index WHERE rowid = old.id * 8 + {code};"
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS search_{kind}_insert AFTER INSERT ON {table} BEGIN {add} END",
+            f"CREATE TRIGGER IF NOT EXISTS search_{kind}_update AFTER UPDATE ON {table} BEGIN {remove} {add} END",
+            f"CREATE TRIGGER IF NOT EXISTS search_{kind}_delete AFTER DELETE ON {table} BEGIN {remove} END",
+        ]
+    return statements
+
+@event.listens_for(db.metadata, "after_create")
+def create_search_index(target, connection, **kw):
+    # FTS5 is SQLite only, other databases fall back to LIKE in search_catalog
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in search_index_ddl():
+        connection.exec_driver_sql(statement)
+
+def fill_search_index(connection):
+    connection.exec_driver_sql("DELETE FROM search_index")
+    for kind, (code, table, title, body) in SEARCH_KINDS.items():
+        connection.exec_driver_sql(
+            f"INSERT INTO search_index(rowid, kind, ref_id, title, body) "
+            f"SELECT new.id * 8 + {code}, '{kind}', new.id, {title}, {body} FROM {table} AS new"
+        )
+
+def search_catalog(search_query, page=1, kind=None, per_page=SEARCH_PER_PAGE):
+    # ranked (kind, id) hits for one page of results, plus whether there is a next page
+    offset = (page - 1) * per_page
+    if db.engine.dialect.name == "sqlite":
+        # every word is a prefix match, all of them have to match
+        terms = " ".join('"' + word.replace('"', '') + '"*' for word in search_query.split() if word.replace('"', ''))
+        if not terms:
+            return [], False
+        kind_filter = " AND kind = :kind" if kind else ""
+        rows = db.session.execute(db.text(
+            f"SELECT kind, ref_id FROM search_index WHERE search_index MATCH :terms{kind_filter} ORDER BY rank LIMIT :limit OFFSET :offset"
+        ), {'terms': terms, 'kind': kind, 'limit': per_page + 1, 'offset': offset}).all()
+    else:
+        pattern = f"%{search_query}%"
+        queries = {
+            'subject': db.select(literal('subject'), Subject.id).where(Subject.name.ilike(pattern)),
+            'chapter': db.select(literal('chapter'), Chapter.id).where(Chapter.name.ilike(pattern)),
+            'quiz': db.select(literal('quiz'), Quiz.id).where(Quiz.quiz_name.ilike(pattern)),
+            'question': db.select(literal('question'), Question.id).where(Question.question.ilike(pattern)),
+            'user': db.select(literal('user'), User.id).where(or_(User.username.ilike(pattern), User.name.ilike(pattern), User.qualification.ilike(pattern))),
+        }
+        selected = [queries[kind]] if kind else list(queries.values())
+        rows = db.session.execute(db.union_all(*selected).limit(per_page + 1).offset(offset)).all()
+    return [(row[0], row[1]) for row in rows[:per_page]], len(rows) > per_page
+
+#migrations
+#schema changes are numbered steps run once each and recorded in schema_version,
+#version 1 is the schema as it was before migrations existed
+MIGRATIONS = []
+
+def migration(version):
+    def decorator(step):
+        MIGRATIONS.append((version, step))
+        return step
+    return decorator
+
+def create_model_indexes():
+    # create every index declared on the models that the database is missing,
+    # indexes on columns a later migration adds are left for that migration
+    connection = db.session.connection()
+    inspector = db.inspect(connection)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            if all(column.name in columns for column in index.columns):
+                index.create(connection, checkfirst=True)
+
+@migration(2)
+def add_attempt_rollup():
+    AttemptRollup.__table__.create(db.session.connection(), checkfirst=True)
+    rebuild_rollups()
+
+@migration(3)
+def add_index_set():
+    # usernames become unique, fold duplicate accounts into the oldest one first
+    db.session.execute(db.text(
+        'UPDATE scores SET user_id = (SELECT MIN(u2.id) FROM "user" u1 JOIN "user" u2 ON u1.username = u2.username WHERE u1.id = scores.user_id)'
+    ))
+    db.session.execute(db.text('DELETE FROM "user" WHERE id NOT IN (SELECT MIN(id) FROM "user" GROUP BY username)'))
+    rebuild_rollups({'user': [row[0] for row in db.session.query(User.id)]})
+    create_model_indexes()
+
+@migration(4)
+def add_search_index():
+    connection = db.session.connection()
+    if connection.dialect.name == "sqlite":
+        create_search_index(db.metadata, connection)
+        fill_search_index(connection)
+
+@migration(5)
+def add_quiz_content_version():
+    db.session.execute(db.text("ALTER TABLE quiz ADD COLUMN content_version INTEGER NOT NULL DEFAULT 0"))
+
+@migration(6)
+def add_scores_answers():
+    db.session.execute(db.text("ALTER TABLE scores ADD COLUMN answers TEXT"))
+
+@migration(7)
+def add_scores_created_at():
+    db.session.execute(db.text("ALTER TABLE scores ADD COLUMN created_at DATETIME"))
+    create_model_indexes()
+
+@migration(8)
+def reset_seeded_admin_password():
+    # passwords used to be hashed twice, which can never be verified, so the seeded admin is
+    # reset to its seed password, other accounts need 'flask reset-password'
+    admin = User.query.filter_by(username="quizmaster@gmail.com", is_admin=True).first()
+    if admin:
+        admin.set_password("admin123")
+
+@migration(9)
+def add_user_rollup():
+    UserRollup.__table__.create(db.session.connection(), checkfirst=True)
+    rebuild_user_rollups()
+
+@migration(10)
+def add_leaderboards():
+    connection = db.session.connection()
+    LeaderboardEntry.__table__.create(connection, checkfirst=True)
+    LeaderboardBucket.__table__.create(connection, checkfirst=True)
+    rebuild_leaderboards()
+
+@migration(11)
+def add_catalog_state():
+    CatalogState.__table__.create(db.session.connection(), checkfirst=True)
+    db.session.add(CatalogState(id = 1, version = 0))
+
+@migration(12)
+def add_quiz_deleted_at():
+    db.session.execute(db.text("ALTER TABLE quiz ADD COLUMN deleted_at DATETIME"))
+
+@migration(13)
+def add_question_banks():
+    db.session.execute(db.text("ALTER TABLE quiz ADD COLUMN from_bank BOOLEAN NOT NULL DEFAULT 0"))
+    # questions made before banks existed join the bank of their quiz's chapter
+    db.session.execute(db.text("UPDATE question SET chapter_id = (SELECT chapter.id FROM quiz JOIN chapter ON chapter.id = quiz.chapter_id "
+                               "WHERE quiz.id = question.quiz_id) WHERE chapter_id IS NULL"))
+
+@migration(14)
+def clear_dangling_references():
+    # the old deletes removed a chapter or subject and left its rows pointing at it, with foreign keys enforced any
+    # write to such a row fails, so nullable references are cleared and rows that can't exist without theirs go
+    connection = db.session.connection()
+    if connection.dialect.name != "sqlite":
+        return
+    dangling = defaultdict(list)
+    for table, rowid, parent, fkid in connection.exec_driver_sql("PRAGMA foreign_key_check").all():
+        dangling[table, fkid].append(rowid)
+    for (table, fkid), rowids in dangling.items():
+        column = next(row[3] for row in connection.exec_driver_sql(f'PRAGMA foreign_key_list("{table}")') if row[0] == fkid)
+        for start in range(0, len(rowids), 500):
+            chunk = ", ".join(str(rowid) for rowid in rowids[start:start + 500])
+            if db.metadata.tables[table].c[column].nullable:
+                connection.exec_driver_sql(f'UPDATE "{table}" SET {column} = NULL WHERE rowid IN ({chunk})')
+            else:
+                connection.exec_driver_sql(f'DELETE FROM "{table}" WHERE rowid IN ({chunk})')
+    if dangling:
+        rebuild_rollups()
+        rebuild_user_rollups()
+        rebuild_leaderboards()
+
+def upgrade_database():
+    SchemaVersion.__table__.create(db.engine, checkfirst=True)
+    current = db.session.query(db.func.max(SchemaVersion.version)).scalar()
+    latest = max(version for version, step in MIGRATIONS)
+    if current is None:
+        if not db.inspect(db.engine).has_table("user"):
+            # empty database, the models already describe the latest schema
+            db.create_all()
+            db.session.add(SchemaVersion(version=latest))
+            db.session.add(CatalogState(id=1, version=0))
+            db.session.commit()
+            return
+        current = 1
+    for version, step in sorted(MIGRATIONS, key=lambda migration: migration[0]):
+        if version > current:
+            step()
+            db.session.add(SchemaVersion(version=version))
+            db.session.commit()
+            current_app.logger.info(f"Applied migration {version} ({step.__name__})")
+
+@command("upgrade-db")
+def upgrade_db_command():
+    """Apply any pending schema migrations."""
+    upgrade_database()
+    print(f"Database at version {db.session.query(db.func.max(SchemaVersion.version)).scalar()}")
+
+@command("reset-password")
+@click.argument("username")
+@click.password_option()
+def reset_password_command(username, password):
+    """Set a new password for a user."""
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        raise click.ClickException(f"No user {username}")
+    user.set_password(password)
+    db.session.commit()
+    print(f"Password changed for {username}")
+
+
+def seed_admin():
+    # Check if an admin user already exists
+    admin = User.query.filter_by(is_admin=True).first()
+    if not admin:
+        admin_user = User(
+            username="quizmaster@gmail.com",
+            name="Quiz Master",  # Add a valid name here
+            password="admin123",
+            qualification="Admin",
+            dob=datetime.strptime("2000-01-01", '%Y-%m-%d').date(),
+            is_admin=True
+        )
+        db.session.add(admin_user)
+        db.session.commit()
+
+def init_database():
+    upgrade_database()
+    seed_admin()
+
+@command("init-db")
+def init_db_command():
+    """Apply pending migrations and create the admin account if there is none. Safe to run repeatedly."""
+    init_database()
+    print(f"Database at version {db.session.query(db.func.max(SchemaVersion.version)).scalar()}")
+
 #REGISTERATION
-@app.route("/register", methods = ['GET','POST'])
+@route("/register", methods = ['GET','POST'])
+@conditional(template_validator("registerpage.html"))
 def register_page():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -150,19 +2020,22 @@ def register_page():
        # if not username or not password or not qualification or not dob:
         #    return redirect(url_for('register_page'))
 
-        hashed_password = generate_password_hash(password)
-
-        new_user = User(username = username, password = hashed_password, name = name ,qualification = qualification, dob = dob)
+        try:
+            new_user = User(username = username, password = password, name = name ,qualification = qualification, dob = dob)
+        except PasswordPoolBusy:
+            flash("Too many sign ups right now, please try again in a moment")
+            return redirect(url_for('register_page'))
         db.session.add(new_user)
         db.session.commit()
         flash("Registeration successful!, Login please!","success")
         return redirect(url_for('login_page'))
     return render_template("registerpage.html")
 
-@app.route("/login")
+@route("/login")
+@conditional(template_validator("loginpage.html"))
 def login_page():
     return render_template("loginpage.html")
-@app.route("/login", methods = ['GET','POST'])
+@route("/login", methods = ['GET','POST'])
 def login_post():
     session.pop('_flashes', None)
 
@@ -171,14 +2044,17 @@ def login_post():
         password = request.form.get('password')
         this_user = User.query.filter_by(username=username).first()
 
-        if not this_user:
-            flash("Invalid username or password", "danger")
+        try:
+            if not this_user or not this_user.check_password(password or ''):
+                flash("Invalid username or password", "danger")
+                return redirect(url_for('login_page'))
+            if password_needs_rehash(this_user.password):
+                this_user.set_password(password)
+                db.session.commit()
+        except PasswordPoolBusy:
+            flash("Too many logins right now, please try again in a moment", "danger")
             return redirect(url_for('login_page'))
 
-        #if not this_user or not this_user.check_password(password):
-         #   flash("Invalid username or password")
-          #  return redirect(url_for('login_page'))
-
         session['username'] = this_user.username
         session['user_id'] = this_user.id
         session['is_admin'] = this_user.is_admin
@@ -192,50 +2068,53 @@ def login_post():
 
 
 #admin dashboard
-@app.route("/admin/dashboard")
+@route("/admin/dashboard")
+@conditional(catalog_validator('subjects'))
+@query_budget(3)
 def admin_dashboard():
-    subjects = Subject.query.all()
-
-    return render_template('admin_dashboard.html', subjects=subjects)
+    cursor = request.args.get('cursor')
+    subject_tree = cached_fragment(('subject_tree', cursor), lambda: render_template('subject_tree.html', subjects=load_subject_tree(cursor)))
+    return render_template('admin_dashboard.html', subject_tree=subject_tree)
 
 #adding subject
-@app.route("/add/subject", methods=['GET', 'POST'])
+@route("/add/subject", methods=['GET', 'POST'])
 def add_subject():
     if request.method == 'POST':
         name = request.form['name']
         description = request.form['description']
         Data = Subject(name = name, description = description)
         db.session.add(Data)
+        catalog_changed()
         db.session.commit()
         flash("Subject created successfully","success")
         return redirect(url_for('admin_dashboard'))
     return render_template('New Subject.html')
 
 
-@app.route("/edit/subject/<int:subject_id>", methods=['GET', 'POST'])
+@route("/edit/subject/<int:subject_id>", methods=['GET', 'POST'])
 def edit_subject(subject_id):
     subject = Subject.query.get(subject_id)
     if request.method == 'POST':
         subject.name = request.form["name"]
         subject.description = request.form["description"]
+        catalog_changed()
         db.session.commit()
         return redirect(url_for('admin_dashboard'))
     return render_template('edit_subject.html', subject=subject)
 
 
-@app.route("/delete/subject/<int:subject_id>", methods = ['GET','POST'])
+@route("/delete/subject/<int:subject_id>", methods = ['GET','POST'])
 def delete_subject(subject_id):
-    subject = Subject.query.get(subject_id)
-    if subject:
-        chapters = Chapter.query.filter_by(subject_id=subject_id).all()
-        for chapter in chapters:
-            db.session.delete(chapter)
-        db.session.delete(subject)
+    if delete_catalog('subject', [subject_id]):
         db.session.commit()
-        return redirect(url_for('admin_dashboard'))
+        start_purge()
+    else:
+        db.session.commit()
+    analytics_cache().invalidate()
+    return redirect(url_for('admin_dashboard'))
 
 #adding chapter
-@app.route("/add/chapter", methods=['GET', 'POST'])
+@route("/add/chapter", methods=['GET', 'POST'])
 def add_chapter():
     if request.method == 'POST':
         name = request.form['name']
@@ -243,13 +2122,14 @@ def add_chapter():
         subject_id = request.form['subject_id']
         Data = Chapter(name = name, questions_count = questions_count, subject_id = subject_id)
         db.session.add(Data)
+        catalog_changed()
         db.session.commit()
         flash("Chapter created successfully")
         return redirect(url_for('admin_dashboard'))
-    subject = Subject.query.all()
-    return render_template('add_chapter.html', subjects = subject)
+    subjects = lookup_options('subject')
+    return render_template('add_chapter.html', subjects = subjects)
 
-@app.route("/edit/chapter/<int:chapter_id>", methods = ['GET','POST'])
+@route("/edit/chapter/<int:chapter_id>", methods = ['GET','POST'])
 def edit_chapter(chapter_id):
     chapter = Chapter.query.get(chapter_id)
     if request.method == 'POST':
@@ -261,74 +2141,103 @@ def edit_chapter(chapter_id):
         chapter.questions_count = questions_count
         chapter.subject_id = subject_id
 
+        catalog_changed()
         db.session.commit()
         flash("Chapter edited")
         return redirect(url_for('admin_dashboard'))
-    subject = Subject.query.all()
-    return render_template('edit_chapter.html', subjects = subject, chapter = chapter)
+    subjects = lookup_options('subject', selected_id = chapter.subject_id)
+    return render_template('edit_chapter.html', subjects = subjects, chapter = chapter)
 
-@app.route("/delete/chapter/<int:chapter_id>", methods = ['GET','POST'])
+@route("/delete/chapter/<int:chapter_id>", methods = ['GET','POST'])
 def delete_chapter(chapter_id):
-    chapter = Chapter.query.get(chapter_id)
-    db.session.delete(chapter)
-    db.session.commit()
+    if delete_catalog('chapter', [chapter_id]):
+        db.session.commit()
+        start_purge()
+    else:
+        db.session.commit()
+    analytics_cache().invalidate()
     return redirect(url_for('admin_dashboard'))
 
 
 #quiz_header
-@app.route("/admin/quiz")
+@route("/admin/quiz")
+@conditional(catalog_validator('quizzes'))
 def Aquiz():
-    quizzes = Quiz.query.all()
-    return render_template("Aquiz.html", quizzes = quizzes)
+    cursor = request.args.get('cursor')
+    quiz_tree = cached_fragment(('quiz_tree', cursor), lambda: render_template(
+        "quiz_tree.html", quizzes = paginate(Quiz.query.options(selectinload(Quiz.questions)).filter(Quiz.deleted_at.is_(None)), Quiz.id, cursor)))
+    return render_template("Aquiz.html", quiz_tree = quiz_tree)
 
 
-@app.route("/create/quiz", methods = ['GET','POST'])
+@route("/create/quiz", methods = ['GET','POST'])
 def create_quiz():
-    chapters = Chapter.query.all()
     if request.method == "POST":
         quiz_name = request.form.get('quiz_name')
         duration = int(request.form.get('duration'))
         chapter_id = int(request.form.get('chapter_id'))
         chapter = Chapter.query.get(chapter_id)
         subject_id = chapter.subject.id
+        from_bank = bool(request.form.get('from_bank'))
 
-        quiz = Quiz(quiz_name = quiz_name, duration = duration, chapter_id = chapter_id,subject_id = subject_id)
+        quiz = Quiz(quiz_name = quiz_name, duration = duration, chapter_id = chapter_id,subject_id = subject_id, from_bank = from_bank)
         db.session.add(quiz)
+        catalog_changed()
         db.session.commit()
 
         flash("successfull")
         return redirect(url_for('Aquiz'))
 
+    chapters = lookup_options('chapter')
     return render_template("create_quiz.html", chapters = chapters)
 
-@app.route("/edit/quiz/<int:quiz_id>", methods = ['GET','POST'])
+@route("/edit/quiz/<int:quiz_id>", methods = ['GET','POST'])
 def edit_quiz(quiz_id):
     quiz = Quiz.query.get(quiz_id)
-    chapters = Chapter.query.all()
     if request.method == "POST":
         quiz.quiz_name = request.form.get('quiz_name')
         quiz.duration = int(request.form.get('duration'))
         quiz.chapter_id = int(request.form.get('chapter_id'))
+        quiz.from_bank = bool(request.form.get('from_bank'))
         chapter = Chapter.query.get(quiz.chapter_id)
 
         quiz.subject_id = chapter.subject.id
+        # the quiz's questions move to the bank of its new chapter
+        Question.query.filter_by(quiz_id = quiz_id).update({Question.chapter_id: quiz.chapter_id}, synchronize_session=False)
+        questions_changed(quiz_id)
         db.session.commit()
         return redirect(url_for('Aquiz'))
+    chapters = lookup_options('chapter', selected_id = quiz.chapter_id)
     return render_template("edit_quiz.html", quiz =quiz, chapters = chapters)
 
-@app.route("/delete/quiz/<int:quiz_id>", methods = ['GET','POST'])
+@route("/delete/quiz/<int:quiz_id>", methods = ['GET','POST'])
 def delete_quiz(quiz_id):
-    quiz = Quiz.query.get(quiz_id)
-    Scores.query.filter_by(quiz_id = quiz_id).delete()
-    Question.query.filter_by(quiz_id = quiz_id).delete()
-    db.session.delete(quiz)
-    db.session.commit()
+    if delete_catalog('quiz', [quiz_id]):
+        db.session.commit()
+        start_purge()
+    else:
+        db.session.commit()
+    analytics_cache().invalidate()
+    question_cache().invalidate(quiz_id)
     return redirect(url_for('Aquiz'))
 
 
 
 
-@app.route("/make/question" , methods = ['GET','POST'])
+@route("/admin/import", methods = ['GET','POST'])
+def import_catalog():
+    if not session.get('is_admin'):
+        return jsonify(error = "admin only"), 403
+    report = None
+    if request.method == "POST":
+        upload = request.files.get('catalog')
+        if not upload or not upload.filename:
+            flash("Choose a CSV or JSONL file to import")
+            return redirect(url_for('import_catalog'))
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+        report = BulkImport().run(read_records(stream, import_format(upload.filename)))
+    return render_template("import.html", report = report)
+
+@route("/make/question" , methods = ['GET','POST'])
 def make_question():
     quiz_id = request.args.get('quiz_id')
 
@@ -341,9 +2250,11 @@ def make_question():
         option4 = request.form['4']
         correct = int(request.form['correct'])
         quiz_id = int(request.form['quiz_id'])
+        chapter_id = db.session.query(Quiz.chapter_id).filter_by(id = quiz_id).scalar()
 
-        question = Question(title = title,question=question, option1 =option1, option2 =option2,option3 =option3, option4 =option4, correct = correct, quiz_id = quiz_id)
+        question = Question(title = title,question=question, option1 =option1, option2 =option2,option3 =option3, option4 =option4, correct = correct, quiz_id = quiz_id, chapter_id = chapter_id)
         db.session.add(question)
+        questions_changed(quiz_id)
         db.session.commit()
         return redirect(url_for('Aquiz'))
     quizzes = Quiz.query.filter_by()
@@ -351,7 +2262,7 @@ def make_question():
 
 
 
-@app.route("/edit/question/<int:question_id>", methods = ['GET','POST'])
+@route("/edit/question/<int:question_id>", methods = ['GET','POST'])
 def edit_question(question_id):
     question = Question.query.get(question_id)
     if request.method == "POST":
@@ -370,50 +2281,88 @@ def edit_question(question_id):
         question.option3 = option3
         question.option4 = option4
         question.correct = correct
+        questions_changed(question.quiz_id)
         db.session.commit()
         flash("Question updated successfully")
         return redirect(url_for('Aquiz'))
     return render_template("edit_question.html", question = question)
 
-@app.route("/delete/question/<int:question_id>", methods = ['GET','POST'])
+@route("/delete/question/<int:question_id>", methods = ['GET','POST'])
 def delete_question(question_id):
-    question = Question.query.get(question_id)
-    db.session.delete(question)
+    quiz_id = db.session.query(Question.quiz_id).filter_by(id = question_id).scalar()
+    Question.query.filter_by(id = question_id).delete(synchronize_session=False)
+    questions_changed(quiz_id)
     db.session.commit()
     return redirect(url_for('Aquiz'))
 
-@app.route("/admin/summary")
+@route("/lookup/<kind>")
+def lookup(kind):
+    # typeahead for the subject, chapter and quiz pickers
+    if kind not in LOOKUP_MODELS:
+        return jsonify(error = "unknown kind"), 404
+    options = lookup_options(kind, request.args.get('q', ''))
+    return jsonify([{'id': option_id, 'name': name} for option_id, name in options])
+
+@route("/admin/export/scores")
+def export_scores():
+    if not session.get('is_admin'):
+        return jsonify(error = "admin only"), 403
+    format = 'jsonl' if request.args.get('format') == 'jsonl' else 'csv'
+    compress = request.args.get('gzip') == '1'
+    try:
+        since, until = parse_day(request.args.get('since')), parse_day(request.args.get('until'))
+    except ValueError:
+        return jsonify(error = "since and until must be dates like 2024-01-31"), 400
+    select = export_select(
+        since, until,
+        request.args.get('subject_id', type=int), request.args.get('chapter_id', type=int), request.args.get('quiz_id', type=int),
+    )
+    chunks = export_chunks(select, format)
+    filename = f"scores.{format}"
+    headers = {}
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+    headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    mimetype = 'application/gzip' if compress else ('text/csv' if format == 'csv' else 'application/x-ndjson')
+    return Response(stream_with_context(chunks), mimetype = mimetype, headers = headers)
+
+@route("/admin/cache")
+def cache_stats():
+    if not session.get('is_admin'):
+        return jsonify(error = "admin only"), 403
+    return jsonify(questions = question_cache().stats(), banks = question_banks().stats())
+
+@route("/admin/summary")
 def Asummary():
-    users = User.query.filter_by(is_admin=0).all()
-    username= []
-    quiz_attempts = []
+    return render_template("Asummay.html")
 
-    for user in users:
-        attempts = Scores.query.filter_by(user_id=user.id).count()
-        username.append(user.username)
-        quiz_attempts.append(attempts)
-
-    return render_template("Asummay.html", username = username, quiz_attempts = quiz_attempts)
-@app.route("/admin/search/all", methods = ['GET','POST'])
+@route("/admin/summary/data")
+@query_budget(1)
+def admin_summary_data():
+    return chart_response(analytics_cache().get('admin', admin_stats))
+@route("/admin/search/all", methods = ['GET','POST'])
 def admin_search():
-    search_query = request.form['search_query']
+    search_query = request.values.get('search_query', '')
+    page = request.args.get('page', 1, type=int)
 
-    #search for quiz
-    quizzes = Quiz.query.filter(Quiz.quiz_name.contains(search_query)).all()
+    hits, has_next = search_catalog(search_query, page)
+    ids = {kind: [ref_id for hit_kind, ref_id in hits if hit_kind == kind] for kind in SEARCH_KINDS}
 
-    #search for users
-    users = User.query.filter(
-        or_(
-            User.username.ilike(f"%{search_query}%"),
-            User.name.ilike(f"%{search_query}%"),
-            User.qualification.ilike(f"%{search_query}%")
-        )
-    ).all()
+    def ranked(model, kind, *options, where=True):
+        # rows for one kind of hit, in the order the search ranked them
+        rows = {row.id: row for row in model.query.options(*options).filter(model.id.in_(ids[kind]), where)} if ids[kind] else {}
+        return [rows[ref_id] for ref_id in ids[kind] if ref_id in rows]
 
-    #search for subjects
-    subjects = Subject.query.filter(Subject.name.contains(search_query)).all()
+    quizzes = ranked(Quiz, 'quiz', where=Quiz.deleted_at.is_(None))
+    users = ranked(User, 'user')
+    subjects = ranked(Subject, 'subject', selectinload(Subject.chapters))
+    chapters = ranked(Chapter, 'chapter', joinedload(Chapter.subject))
+    questions = ranked(Question, 'question', joinedload(Question.quiz), where=Question.quiz.has(Quiz.deleted_at.is_(None)))
+    question_counts = load_question_counts(ids['quiz'])
 
-    return render_template("search.html",quizzes = quizzes,users = users,subjects = subjects)
+    return render_template("search.html",quizzes = quizzes,users = users,subjects = subjects, chapters = chapters, questions = questions,
+                           question_counts = question_counts, search_query = search_query, page = page, has_next = has_next)
 
 
 
@@ -421,75 +2370,126 @@ def admin_search():
 
 
 #user dashboard
-@app.route("/user/dashboard", methods = ['GET'])
+@route("/user/dashboard", methods = ['GET'])
+@query_budget(4)
 def user_dashboard():
     username = session.get("username")
     user = User.query.filter_by(username = username).first()
     #user = User.query.get(session['user_id'])
-    quizzes = Quiz.query.all()
-    chapters = Chapter.query.all()
 
-    attempted_quizzes_ids = session.get(f"attempted_quizzes_{user.id}",[])
+    attempted_quizzes_ids = attempted_quiz_ids(user.id)
 
-    available_quizzes = [quiz for quiz in quizzes if quiz.id not in attempted_quizzes_ids]
-    attempted_quiz_data = [quiz for quiz in quizzes if quiz.id in attempted_quizzes_ids]
-    user_scores = Scores.query.filter(Scores.user_id == user.id, Scores.quiz_id.in_(attempted_quizzes_ids)).all()
+    live_quizzes = Quiz.query.filter(Quiz.deleted_at.is_(None))
+    available_quizzes = paginate(live_quizzes.options(joinedload(Quiz.chapter)).filter(Quiz.id.not_in(attempted_quizzes_ids)), Quiz.id, request.args.get('cursor'))
+    attempted_quiz_data = paginate(live_quizzes.filter(Quiz.id.in_(attempted_quizzes_ids)), Quiz.id, request.args.get('attempted_cursor'))
+    question_counts = load_question_counts([quiz.id for quiz in available_quizzes.items])
 
-    return render_template("user_dashboard.html", quizzes =available_quizzes, user = user,chapters = chapters, attempted_quiz = attempted_quiz_data, user_scores = user_scores)
+    return render_template("user_dashboard.html", quizzes =available_quizzes, user = user, attempted_quiz = attempted_quiz_data, question_counts = question_counts)
 
 
 
-@app.route("/view/quiz/<int:quiz_id>", methods = ['GET','POST'])
+@route("/view/quiz/<int:quiz_id>", methods = ['GET','POST'])
 def view_quiz(quiz_id):
-    quiz = Quiz.query.get(quiz_id)
+    quiz = live_quiz(quiz_id)
     chapter = Chapter.query.get(quiz.chapter_id)
     subject = Subject.query.get(quiz.subject_id)
-    print(f"Subject:{subject}")
     return render_template("view_quiz_details.html", quiz = quiz,chapter = chapter,subject = subject)
 
-@app.route("/start/quiz/<int:quiz_id>")
+@route("/start/quiz/<int:quiz_id>")
 def start_quiz(quiz_id):
-    quiz = Quiz.query.get(quiz_id)
-    questions = Question.query.filter_by(quiz_id = quiz.id).all()
+    quiz = live_quiz(quiz_id)
+    if quiz.from_bank:
+        questions = draw_paper(quiz)
+        session['paper'] = [quiz_id, pack_paper([question['id'] for question in questions])]
+    else:
+        questions, answer_key = question_cache().get(quiz)
     return render_template("start_quiz.html",quiz = quiz,questions = questions)
 
 
 
 
-@app.route("/submit/quiz/<int:quiz_id>", methods = ['GET','POST'])
+@route("/submit/quiz/<int:quiz_id>", methods = ['GET','POST'])
 def submit_quiz(quiz_id):
-    quiz = Quiz.query.get(quiz_id)
-    questions = Question.query.filter_by(quiz_id = quiz_id).all()
-    score = 0
-
-    for question in questions:
-        selected = request.form.get(f"q{question.id}")
-        if selected:
-            if int(selected) == question.correct:
-                score += 1
+    quiz = live_quiz(quiz_id)
+    if quiz.from_bank:
+        paper = session.get('paper')
+        if not paper or paper[0] != quiz_id:
+            flash("Start the quiz to get your questions")
+            return redirect(url_for('view_quiz', quiz_id = quiz_id))
+        questions = unpack_paper(paper[1])
+        answer_key = paper_answer_key(questions)
+        answers = {question_id: parse_choice(request.form.get(f"q{question_id}")) for question_id in questions}
+    else:
+        questions, answer_key = question_cache().get(quiz)
+        answers = {question_id: parse_choice(request.form.get(f"q{question_id}")) for question_id in answer_key}
+    score = grade_batch(answer_key, [answers])[0]
 
     subject_id = quiz.subject_id
     chapter_id = quiz.chapter_id
 
-    user_id = session['user_id']
-    attempted_quizzes = session.get(f'attempted_quizzes_{user_id}',[])
-    if quiz_id not in attempted_quizzes:
-        attempted_quizzes.append(quiz_id)
-        session[f"attempted_quizzes_{user_id}"] =attempted_quizzes
-
-    new_score = Scores(user_id = session['user_id'],quiz_id = quiz_id,score=score, total = len(questions), subject_id = subject_id, chapter_id = chapter_id)
-    db.session.add(new_score)
-    db.session.commit()
-
+    new_score = dict(user_id = session['user_id'],quiz_id = quiz_id,score=score, total = len(questions), subject_id = subject_id, chapter_id = chapter_id,
+                     answers = dump_answers(answers), created_at = datetime.utcnow())
+    try:
+        queue_submission(new_score)
+    except SubmissionQueueFull:
+        # the paper comes back with the answers still marked so nothing the student picked is lost
+        flash("Too many submissions right now, your answers are kept below, please submit again in a moment")
+        paper = paper_questions(questions) if quiz.from_bank else questions
+        return render_template("start_quiz.html", quiz = quiz, questions = paper, answers = answers), 503
+    session.pop('paper', None)
+    flash(f"You scored {score} out of {len(questions)}")
 
     return redirect(url_for('user_scores',quiz_id = quiz_id))
     #return render_template("Uscores.html",quiz = quiz, score = score,total = len(questions))
 
-@app.route("/user/profile", methods = ['GET','POST'])
+@route("/bulk/submit/quiz/<int:quiz_id>", methods = ['POST'])
+def bulk_submit_quiz(quiz_id):
+    # JSON {"submissions": [{"user_id": 1, "answers": {"<question id>": <option>}}]}, graded in one pass
+    if not session.get('is_admin'):
+        return jsonify(error = "admin only"), 403
+    quiz = Quiz.query.get(quiz_id)
+    if not quiz or quiz.deleted_at:
+        return jsonify(error = "no such quiz"), 404
+    if quiz.from_bank:
+        return jsonify(error = "quiz draws a paper per attempt, submit through /submit/quiz"), 400
+    payload = request.get_json(silent = True)
+    submissions = payload.get('submissions') if isinstance(payload, dict) else None
+    if not isinstance(submissions, list):
+        return jsonify(error = "body must be {\"submissions\": [...]}"), 400
+    for number, submission in enumerate(submissions):
+        if not isinstance(submission, dict) or type(submission.get('user_id')) is not int or not isinstance(submission.get('answers'), dict) \
+                or not all(str(question_id).isdigit() for question_id in submission['answers']):
+            return jsonify(error = f"submission {number} needs an integer user_id and an answers object keyed by question id"), 400
+    # unknown users get a 400 naming them rather than a foreign key error
+    user_ids = {submission['user_id'] for submission in submissions}
+    known = {row[0] for row in db.session.query(User.id).filter(User.id.in_(user_ids))} if user_ids else set()
+    if user_ids - known:
+        return jsonify(error = "unknown user ids", user_ids = sorted(user_ids - known)), 400
+    questions, answer_key = question_cache().get(quiz)
+
+    answers = [load_answers(json.dumps(submission['answers'])) for submission in submissions]
+    scores = grade_batch(answer_key, answers)
+    now = datetime.utcnow()
+    rows = [
+        dict(user_id = submission['user_id'], quiz_id = quiz_id, score = score, total = len(answer_key),
+             subject_id = quiz.subject_id, chapter_id = quiz.chapter_id, answers = dump_answers(submitted), created_at = now)
+        for submission, submitted, score in zip(submissions, answers, scores)
+    ]
+    if rows:
+        save_submissions(rows)
+    return jsonify(graded = len(rows), scores = scores)
+
+@route("/user/profile", methods = ['GET','POST'])
 def user_profile():
     user = User.query.get(session['user_id'])
     if request.method == 'POST':
-        user.username = request.form['username']
+        username = request.form['username']
+        taken = User.query.filter(User.username == username, User.id != user.id).first()
+        if taken:
+            flash("That username is already taken")
+            return redirect(url_for('user_profile'))
+        user.username = username
+        session['username'] = username
         user.name = request.form['name']
         user.qualification = request.form['qualification']
         user.dob = datetime.strptime(request.form.get('dob'), "%Y-%m-%d").date()
@@ -499,11 +2499,12 @@ def user_profile():
 
     return render_template("user_profile.html", user = user)
 
-@app.route("/user/scores/<int:quiz_id>")
+@route("/user/scores/<int:quiz_id>")
+@query_budget(2)
 def user_scores(quiz_id):
     score = session.get(f'quiz_{quiz_id}_score',0)
     quiz = Quiz.query.get(quiz_id)
-    user_scores = Scores.query.filter_by(user_id=session['user_id']).all()
+    user_scores = load_user_scores(session['user_id'], request.args.get('cursor'))
     return render_template("Uscores.html", user_scores = user_scores, score = score,quiz = quiz)
 
 
@@ -522,19 +2523,122 @@ def search_by_chapter():
 
     return redirect(url_for("user_dashboard"))"""
 
-@app.route("/user/summary")
+@route("/user/summary")
 def user_summary():
-    chapter_quiz_count = db.session.query(Chapter.name, db.func.count(Quiz.id)).join(Quiz).group_by(Chapter.id).all()
-    labels = [chapter[0] for chapter in chapter_quiz_count]
-    quiz_counts = [chapter[1] for chapter in chapter_quiz_count]
+    return render_template("Usummary.html")
 
-    total_quizzes_count = db.session.query(db.func.count(Quiz.id)).scalar()
+@route("/user/summary/data")
+@query_budget(6)
+def user_summary_data():
     user_id = session['user_id']
-    attempted_quizzes = session.get(f'attempted_quizzes_{user_id}',[])
-    attempted_quizzes_count = len(attempted_quizzes)
-    return render_template("Usummary.html",labels=labels,quiz_counts=quiz_counts, total_quizzes_count=total_quizzes_count, attempted_quizzes_count=attempted_quizzes_count)
-
+    payload = dict(analytics_cache().get('catalog', catalog_stats))
+    payload.update(analytics_cache().get(('user', user_id), lambda: user_stats(user_id)))
+    return chart_response(payload)
+
+
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    # the directory is made when the first template is compiled, building an app leaves nothing on disk
+    def dump_bytecode(self, bucket):
+        os.makedirs(self.directory, exist_ok=True)
+        super().dump_bytecode(bucket)
+
+def watch_engine(engine):
+    # on the app's own engine rather than the Engine class, importing the module twice would count every query twice
+    event.listen(engine, "connect", configure_sqlite)
+    event.listen(engine, "before_cursor_execute", count_query)
+    event.listen(engine, "before_cursor_execute", start_query_timer)
+    event.listen(engine, "after_cursor_execute", stop_query_timer)
+
+def create_app(config=None):
+    app = Flask(__name__)
+    # Set the secret key to a random value
+    app.secret_key = "SECRET KEY"
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///Quizblitz.db'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # how many questions the in-process question cache may hold across all quizzes
+    app.config['QUESTION_CACHE_MAX_QUESTIONS'] = 50000
+    # how many question ids the per-worker bank cache may hold across all chapters
+    app.config['QUESTION_BANK_MAX_QUESTIONS'] = 2000000
+    # SQLite connection settings, WAL lets readers carry on while a submission commits
+    app.config['SQLITE_JOURNAL_MODE'] = 'WAL'
+    app.config['SQLITE_SYNCHRONOUS'] = 'NORMAL'
+    app.config['SQLITE_BUSY_TIMEOUT'] = 5000
+    # connection pool, used for file databases and server databases alike
+    app.config['DB_POOL_SIZE'] = 10
+    app.config['DB_MAX_OVERFLOW'] = 20
+    app.config['DB_POOL_TIMEOUT'] = 30
+    app.config['DB_POOL_RECYCLE'] = 1800
+    # werkzeug hash method and cost for new passwords, older hashes are upgraded at the next login
+    app.config['PASSWORD_HASH_METHOD'] = 'scrypt:32768:8:1'
+    # threads doing password hashing, and how many more requests may wait for one before getting "busy"
+    app.config['PASSWORD_HASH_WORKERS'] = 2
+    app.config['PASSWORD_HASH_QUEUE'] = 32
+    # seconds summary chart data is reused before it is recomputed
+    app.config['ANALYTICS_CACHE_TTL'] = 60
+    # chart payloads kept per worker, one per user who opened their summary plus the shared ones
+    app.config['ANALYTICS_CACHE_SIZE'] = 10000
+    # submissions waiting for the writer thread (0 commits each one in its request), rows per commit,
+    # seconds the writer waits to fill a batch, and seconds a submission waits for room before being turned away
+    app.config['SUBMIT_QUEUE_SIZE'] = 2048
+    app.config['SUBMIT_BATCH_SIZE'] = 256
+    app.config['SUBMIT_FLUSH_INTERVAL'] = 0.05
+    app.config['SUBMIT_QUEUE_TIMEOUT'] = 2
+    # bearer token /metrics asks for, None leaves it open to whoever can reach the app
+    app.config['METRICS_TOKEN'] = None
+    # requests slower than this many ms are profiled to PROFILE_DIR (default instance/profiles), 0 turns the profiler off
+    app.config['PROFILE_SLOW_REQUEST_MS'] = 0
+    app.config['PROFILE_SAMPLE_INTERVAL'] = 0.005
+    app.config['PROFILE_DIR'] = None
+    # compiled templates are kept here so a new worker does not compile them again, None compiles in memory only
+    app.config['JINJA_BYTECODE_CACHE_DIR'] = os.path.join(app.instance_path, 'jinja-cache')
+    # rendered catalog fragments kept per worker
+    app.config['FRAGMENT_CACHE_SIZE'] = 256
+    # deletes touching more questions and scores than this are soft-deleted and purged in the background, PURGE_CHUNK rows per commit
+    app.config['PURGE_INLINE_LIMIT'] = 5000
+    app.config['PURGE_CHUNK'] = 2000
+
+    # overrides: a settings file named by QUIZBLITZ_SETTINGS, then QUIZBLITZ_<KEY> environment variables,
+    # e.g. QUIZBLITZ_SQLALCHEMY_DATABASE_URI=postgresql://... points the same models at a server database,
+    # then whatever the caller passes in
+    app.config.from_envvar('QUIZBLITZ_SETTINGS', silent=True)
+    app.config.from_prefixed_env('QUIZBLITZ')
+    app.config.update(config or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    if app.config['JINJA_BYTECODE_CACHE_DIR']:
+        app.jinja_options = {**app.jinja_options, 'bytecode_cache': TemplateBytecodeCache(app.config['JINJA_BYTECODE_CACHE_DIR'])}
+
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            watch_engine(engine)
+    app.extensions['question_cache'] = QuestionCache(app.config['QUESTION_CACHE_MAX_QUESTIONS'])
+    app.extensions['question_banks'] = QuestionBanks(app.config['QUESTION_BANK_MAX_QUESTIONS'])
+    app.extensions['analytics_cache'] = AnalyticsCache(app.config['ANALYTICS_CACHE_TTL'], app.config['ANALYTICS_CACHE_SIZE'])
+    app.extensions['submission_queue'] = SubmissionQueue(app.config['SUBMIT_QUEUE_SIZE'], app.config['SUBMIT_BATCH_SIZE'],
+                                                         app.config['SUBMIT_FLUSH_INTERVAL'], app.config['SUBMIT_QUEUE_TIMEOUT'])
+    app.extensions['fragment_cache'] = FragmentCache(app.config['FRAGMENT_CACHE_SIZE'])
+    app.extensions['request_metrics'] = RequestMetrics()
+    app.extensions['profiler'] = SlowRequestProfiler(app.config['PROFILE_SLOW_REQUEST_MS'], app.config['PROFILE_SAMPLE_INTERVAL'],
+                                                     app.config['PROFILE_DIR'] or os.path.join(app.instance_path, 'profiles')) if app.config['PROFILE_SLOW_REQUEST_MS'] else None
+    app.extensions['password_slots'] = BoundedSemaphore(app.config['PASSWORD_HASH_WORKERS'] + app.config['PASSWORD_HASH_QUEUE'])
+
+    for rule, view, options in views:
+        app.add_url_rule(rule, view_func=view, **options)
+    app.before_request(start_request_timer)
+    app.after_request(check_query_budget)
+    app.after_request(record_request_metrics)
+    app.teardown_request(finish_request_profile)
+    before_render_template.connect(start_render_timer, app)
+    template_rendered.connect(stop_render_timer, app)
+    app.add_template_global(page_url)
+    for cli_command in commands:
+        app.cli.add_command(cli_command)
+    return app
 
 
 if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        init_database()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""Apps for the tests are built with load_app from bench/common.py, the same way the benchmarks build theirs."""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+from common import load_app  # noqa: E402
+
+TEST_CONFIG = {
+    'TESTING': True,
+    'JINJA_BYTECODE_CACHE_DIR': None,
+    # submissions are written in the request so the rollups and boards are filled before the reads
+    'SUBMIT_QUEUE_SIZE': 0,
+}
+
+
+@pytest.fixture(scope='session')
+def make_app():
+    # (module, app) on the given SQLite file, migrated and with the admin seeded
+    def make(database, **config):
+        return load_app(f'sqlite:///{database}', **{**TEST_CONFIG, **config})
+    return make
+
+
+def kept_totals(quiz):
+    # everything kept alongside Scores, sorted so two states can be compared
+    db = quiz.db
+    db.session.remove()
+    return {
+        'attempt_rollup': sorted(db.session.query(quiz.AttemptRollup.scope, quiz.AttemptRollup.scope_id, quiz.AttemptRollup.attempts,
+                                                  quiz.AttemptRollup.score_sum, quiz.AttemptRollup.best_score).all()),
+        'user_rollup': sorted(db.session.query(quiz.UserRollup.user_id, quiz.UserRollup.scope, quiz.UserRollup.scope_key,
+                                               quiz.UserRollup.attempts, quiz.UserRollup.score_sum, quiz.UserRollup.total_sum).all()),
+        'leaderboard': sorted(db.session.query(quiz.LeaderboardEntry.scope, quiz.LeaderboardEntry.scope_id, quiz.LeaderboardEntry.user_id,
+                                               quiz.LeaderboardEntry.points).all()),
+        # upkeep can leave a bucket at zero users where a rebuild writes none
+        'leaderboard_bucket': sorted(db.session.query(quiz.LeaderboardBucket.scope, quiz.LeaderboardBucket.scope_id,
+                                                      quiz.LeaderboardBucket.points, quiz.LeaderboardBucket.users).filter(
+            quiz.LeaderboardBucket.users > 0).all()),
+    }
+
+
+@pytest.fixture(scope='session')
+def assert_matches_rebuild():
+    # the rollups and boards as kept equal what rebuilding them from Scores gives, call inside an app context
+    def check(quiz):
+        kept = kept_totals(quiz)
+        quiz.rebuild_rollups()
+        quiz.rebuild_user_rollups()
+        quiz.rebuild_leaderboards()
+        quiz.db.session.commit()
+        rebuilt = kept_totals(quiz)
+        for table in kept:
+            assert kept[table] == rebuilt[table], table
+        return kept
+    return check
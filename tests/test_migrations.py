@@ -0,0 +1,82 @@
+"""The database shipped in "instance copy" upgrades through every migration.
+
+It predates the migrations, so init_database runs all of them on it, with
+foreign keys enforced the way the app always connects.
+"""
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+LEGACY_DATABASE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance copy', 'Quizblitz.db')
+CATALOG = ('user', 'subject', 'chapter', 'quiz', 'question', 'scores')
+
+
+def legacy_copy(directory, *statements):
+    # the shipped database copied to directory, statements run on the copy before anything upgrades it
+    database = directory / 'Quizblitz.db'
+    shutil.copy(LEGACY_DATABASE, database)
+    connection = sqlite3.connect(database)
+    for statement in statements:
+        connection.execute(statement)
+    connection.commit()
+    counts = {table: connection.execute(f'SELECT count(*) FROM "{table}"').fetchone()[0] for table in CATALOG}
+    # migration 3 folds accounts sharing a username into the oldest, the shipped file has the admin seeded many times over
+    counts['user'] = connection.execute('SELECT count(DISTINCT username) FROM "user"').fetchone()[0]
+    connection.close()
+    return database, counts
+
+
+def upgraded(quiz):
+    connection = quiz.db.session.connection()
+    return {
+        'version': quiz.db.session.query(quiz.db.func.max(quiz.SchemaVersion.version)).scalar(),
+        'foreign_keys': connection.exec_driver_sql("PRAGMA foreign_keys").scalar(),
+        'dangling': connection.exec_driver_sql("PRAGMA foreign_key_check").all(),
+        'counts': {table: connection.exec_driver_sql(f'SELECT count(*) FROM "{table}"').scalar() for table in CATALOG},
+    }
+
+
+@pytest.fixture
+def legacy(tmp_path):
+    return legacy_copy(tmp_path)
+
+
+def test_upgrade_keeps_everything(legacy, make_app, assert_matches_rebuild):
+    database, before = legacy
+    quiz, app = make_app(database)
+    with app.app_context():
+        state = upgraded(quiz)
+        assert state['version'] == max(version for version, step in quiz.MIGRATIONS)
+        assert state['foreign_keys'] == 1 and state['dangling'] == []
+        assert state['counts'] == before
+        # usernames are unique from migration 3 on
+        indexes = quiz.db.inspect(quiz.db.engine).get_indexes('user')
+        assert any(index['unique'] and index['column_names'] == ['username'] for index in indexes)
+        # migration 13 put every question in its quiz's chapter bank
+        assert quiz.Question.query.filter(quiz.Question.chapter_id.is_(None)).count() == 0
+        assert_matches_rebuild(quiz)
+        user = quiz.User.query.filter_by(is_admin=False).join(quiz.Scores).first()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session.update(user_id=user.id, username=user.username, is_admin=False)
+    assert client.get('/user/dashboard').status_code == 200
+    assert client.get('/user/summary/data').status_code == 200
+
+
+def test_upgrade_clears_dangling_references(tmp_path, make_app, assert_matches_rebuild):
+    # what the original deletes left behind: a chapter removed under its quizzes, a quiz removed under its questions and scores
+    database, before = legacy_copy(tmp_path, 'DELETE FROM chapter WHERE id = 1', 'DELETE FROM quiz WHERE id = 2')
+    quiz, app = make_app(database)
+    with app.app_context():
+        state = upgraded(quiz)
+        assert state['dangling'] == []
+        assert quiz.Question.query.filter_by(quiz_id=2).count() == 0 and quiz.Scores.query.filter_by(quiz_id=2).count() == 0
+        assert quiz.db.session.get(quiz.Quiz, 1).chapter_id is None
+        assert state['counts']['user'] == before['user'] and state['counts']['quiz'] == before['quiz']
+        assert_matches_rebuild(quiz)
+        # the rows that were left dangling can be written again
+        quiz.Scores.query.filter_by(quiz_id=1).update({quiz.Scores.score: 1})
+        quiz.db.session.commit()
@@ -0,0 +1,132 @@
+"""Routes stay within their @query_budget on a catalog with several subjects, chapters and quizzes.
+
+Under TESTING check_query_budget raises when a route runs more statements
+than it declares, so these requests fail the moment an N+1 comes back.
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def built(make_app, tmp_path_factory):
+    quiz, app = make_app(tmp_path_factory.mktemp('budget') / 'budget.db')
+    with app.app_context():
+        build_catalog(quiz)
+    return quiz, app
+
+
+@pytest.fixture(scope='module')
+def quiz(built):
+    return built[0]
+
+
+@pytest.fixture(scope='module')
+def app(built):
+    return built[1]
+
+
+def build_catalog(quiz):
+    # 3 subjects x 3 chapters x 3 quizzes x 5 questions, 6 users who each attempt most quizzes
+    db = quiz.db
+    users = [quiz.User(username=f'learner{number}@test', password='x', name=f'Learner {number}', qualification='-',
+                       dob=date(2000, 1, 1)) for number in range(6)]
+    db.session.add_all(users)
+    quizzes = []
+    for subject_number in range(3):
+        subject = quiz.Subject(name=f'Subject {subject_number}', description='-')
+        db.session.add(subject)
+        db.session.flush()
+        for chapter_number in range(3):
+            chapter = quiz.Chapter(name=f'Chapter {subject_number}.{chapter_number}', questions_count=5, subject_id=subject.id)
+            db.session.add(chapter)
+            db.session.flush()
+            for quiz_number in range(3):
+                item = quiz.Quiz(quiz_name=f'Quiz {subject_number}.{chapter_number}.{quiz_number}', duration=10,
+                                 chapter_id=chapter.id, subject_id=subject.id)
+                db.session.add(item)
+                db.session.flush()
+                db.session.add_all([quiz.Question(quiz_id=item.id, chapter_id=chapter.id, title=f'Q{number}', question='?',
+                                                  option1='a', option2='b', option3='c', option4='d', correct=number % 4 + 1)
+                                    for number in range(5)])
+                quizzes.append(item)
+    quiz.catalog_changed()
+    db.session.commit()
+
+    started = datetime.utcnow() - timedelta(days=10)
+    rows = []
+    for user_number, user in enumerate(users):
+        for quiz_number, item in enumerate(quizzes):
+            if (user_number + quiz_number) % 4 == 0:
+                continue
+            score = (user_number * 7 + quiz_number) % 6
+            rows.append(dict(user_id=user.id, quiz_id=item.id, score=score, total=5, subject_id=item.subject_id,
+                             chapter_id=item.chapter_id, answers=None, created_at=started + timedelta(hours=quiz_number)))
+    quiz.save_submissions(rows)
+
+
+def login(client, quiz, username):
+    with client.application.app_context():
+        user = quiz.User.query.filter_by(username=username).one()
+        identity = dict(username=user.username, user_id=user.id, is_admin=bool(user.is_admin))
+    with client.session_transaction() as session:
+        session.update(identity)
+    return identity
+
+
+@pytest.fixture
+def admin(app, quiz):
+    client = app.test_client()
+    login(client, quiz, 'quizmaster@gmail.com')
+    return client
+
+
+@pytest.fixture
+def learner(app, quiz):
+    client = app.test_client()
+    login(client, quiz, 'learner1@test')
+    return client
+
+
+def test_admin_dashboard(admin):
+    assert admin.get('/admin/dashboard').status_code == 200
+
+
+def test_user_dashboard(learner):
+    response = learner.get('/user/dashboard')
+    assert response.status_code == 200
+    assert b'Quiz 0.0.' in response.data
+
+
+def test_user_scores(learner):
+    response = learner.get('/user/scores/1')
+    assert response.status_code == 200
+    assert b'Quiz 0.0.' in response.data
+
+
+def test_user_summary_data(learner):
+    response = learner.get('/user/summary/data')
+    assert response.status_code == 200
+    assert response.get_json()['total_quizzes_count'] == 27
+
+
+@pytest.mark.parametrize('scope, scope_id', [('quiz', 2), ('chapter', 1), ('subject', 1)])
+def test_leaderboard(learner, scope, scope_id):
+    response = learner.get(f'/leaderboard/{scope}/{scope_id}')
+    assert response.status_code == 200
+    board = response.get_json()
+    assert board['top'] and board['me']['rank'] >= 1
+
+
+def test_over_budget_fails(app, learner, monkeypatch):
+    # the check is what makes the tests above mean something
+    monkeypatch.setattr(app.view_functions['user_scores'], 'query_budget', 0)
+    with pytest.raises(AssertionError, match='budget is 0'):
+        learner.get('/user/scores/1')
+
+
+def test_module_imported_twice(learner, make_app, tmp_path):
+    # a second copy of the module in the process builds its own app, the queries of this one aren't counted twice
+    make_app(tmp_path / 'other.db')
+    assert learner.get('/user/summary/data').status_code == 200
+    assert learner.get('/user/scores/1').status_code == 200
@@ -0,0 +1,85 @@
+"""Rollups and leaderboards kept up by save_submissions match a rebuild from Scores.
+
+record_attempts and record_leaderboards apply each batch incrementally, the
+rebuild_* functions recompute from scratch. Random batches, some written from
+several threads at once, must leave both in the same state.
+"""
+import random
+import threading
+from datetime import date, datetime, timedelta
+
+import pytest
+
+USERS = 12
+BATCHES = 30
+
+
+@pytest.fixture(scope='module')
+def built(make_app, tmp_path_factory):
+    quiz, app = make_app(tmp_path_factory.mktemp('upkeep') / 'upkeep.db')
+    with app.app_context():
+        db = quiz.db
+        db.session.add_all([quiz.User(username=f'player{number}@test', password='x', name='Player', qualification='-',
+                                      dob=date(2000, 1, 1)) for number in range(USERS)])
+        for subject_number in range(2):
+            subject = quiz.Subject(name=f'Subject {subject_number}')
+            db.session.add(subject)
+            db.session.flush()
+            for chapter_number in range(2):
+                chapter = quiz.Chapter(name=f'Chapter {chapter_number}', questions_count=5, subject_id=subject.id)
+                db.session.add(chapter)
+                db.session.flush()
+                db.session.add_all([quiz.Quiz(quiz_name=f'Quiz {number}', duration=10, chapter_id=chapter.id, subject_id=subject.id)
+                                    for number in range(2)])
+        db.session.commit()
+        users = [row[0] for row in db.session.query(quiz.User.id).filter(quiz.User.username.like('player%@test'))]
+        quizzes = db.session.query(quiz.Quiz.id, quiz.Quiz.chapter_id, quiz.Quiz.subject_id).all()
+    return quiz, app, users, quizzes
+
+
+def random_batch(rng, users, quizzes):
+    # few users, quizzes and score values, so batches repeat users, tie on points and beat earlier bests
+    started = datetime(2026, 1, 1)
+    rows = []
+    for _ in range(rng.randint(1, 20)):
+        quiz_id, chapter_id, subject_id = rng.choice(quizzes)
+        rows.append(dict(user_id=rng.choice(users), quiz_id=quiz_id, chapter_id=chapter_id, subject_id=subject_id,
+                         score=rng.randint(0, 5), total=5, answers=None,
+                         created_at=started + timedelta(days=rng.randint(0, 3), minutes=rng.randint(0, 600))))
+    return rows
+
+
+def test_random_batches(built, assert_matches_rebuild):
+    quiz, app, users, quizzes = built
+    rng = random.Random(15)
+    with app.app_context():
+        for _ in range(BATCHES):
+            quiz.save_submissions(random_batch(rng, users, quizzes))
+            assert_matches_rebuild(quiz)
+
+
+def test_concurrent_batches(built, assert_matches_rebuild):
+    quiz, app, users, quizzes = built
+    rng = random.Random(16)
+    batches = [[random_batch(rng, users, quizzes) for _ in range(BATCHES // 3)] for _ in range(3)]
+    failures = []
+
+    def writer(own):
+        with app.app_context():
+            try:
+                for rows in own:
+                    quiz.save_submissions(rows)
+            except Exception as error:
+                failures.append(error)
+            finally:
+                quiz.db.session.remove()
+
+    threads = [threading.Thread(target=writer, args=(own,)) for own in batches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert failures == []
+    with app.app_context():
+        kept = assert_matches_rebuild(quiz)
+        assert kept['leaderboard'] and kept['leaderboard_bucket']